@@ -1,8 +1,9 @@
 from flask import Flask
-from app.src import db, todo, api
+from app.src import db, todo, api, cache, metrics, profiler
 from pathlib import Path
 import os
 import secrets
+import sqlite3
 
 
 def create_app(test_config: dict = None, instance_path: str | Path = None):
@@ -15,6 +16,31 @@ def create_app(test_config: dict = None, instance_path: str | Path = None):
     if not os.path.exists(app.instance_path):
         os.makedirs(app.instance_path)
     app.config['DATABASE'] = Path(app.instance_path) / 'app.sqlite'
+    # connection pool settings (see db.ConnectionPool)
+    app.config.from_mapping(
+        DB_POOL_SIZE=5,
+        DB_BUSY_TIMEOUT=5000,
+        DB_CACHE_SIZE=-8000,
+        DB_MMAP_SIZE=64 * 1024 * 1024,
+        # number of cached task views, 0 disables the cache
+        TASK_CACHE_SIZE=128,
+        # approximate memory limit of the cached task views (bytes)
+        TASK_CACHE_BYTES=64 * 1024 * 1024,
+        # derive parent task status from the status of the child tasks
+        STATUS_ROLLUP=True,
+        # count and time sql statements (Server-Timing, /api/v1/metrics)
+        SQL_METRICS=True,
+        # log statements slower than this (ms) with their query plan
+        # to SLOW_QUERY_LOG in the instance folder, None disables it
+        SLOW_QUERY_MS=200,
+        SLOW_QUERY_LOG='slow_queries.log',
+        # run requests with ?profile=1 or the X-Profile header under
+        # cProfile, stats are written to PROFILER_DIR in the instance folder
+        PROFILER=False,
+        PROFILER_ALLOWED=('127.0.0.1', '::1'),
+        PROFILER_DIR='profiles',
+        PROFILER_KEEP=50,
+    )
 
     # check and create basic_config.py
     config_path = Path(app.instance_path) / 'basic_config.py'
@@ -26,15 +52,32 @@ def create_app(test_config: dict = None, instance_path: str | Path = None):
     # if dev_config.py exist, it will overwrite existing configs
     app.config.from_pyfile('dev_config.py', silent=True)
 
-    # if test_config is provided, don't init_db
+    # if test_config is provided, don't touch the database
     if test_config:
         app.config.from_mapping(**test_config)
     else:
-        db.init_db(app.instance_path)
+        # only apply missing migrations, existing data is kept.
+        # sample data is loaded when the database is newly created.
+        db.upgrade_db(app.config['DATABASE'], load_sample=True)
+
+    # cache of assembled task views, invalidated on every write
+    cache.init_app(app)
+
+    # per request sql metrics and slow query log
+    metrics.init_app(app)
+
+    # opt-in cProfile of single requests
+    profiler.init_app(app)
 
     # close db after request call
     app.teardown_appcontext(db.close_db)
 
+    # busy database: 503 instead of 500
+    app.register_error_handler(sqlite3.OperationalError, db.handle_locked)
+
+    # flask db upgrade / flask db init
+    app.cli.add_command(db.db_cli)
+
     # include blueprints
     app.register_blueprint(todo.bp)
     app.register_blueprint(api.bp)
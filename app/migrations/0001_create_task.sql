@@ -1,7 +1,4 @@
-DROP TABLE IF EXISTS task;
-
-
-CREATE TABLE task(
+CREATE TABLE IF NOT EXISTS task(
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     parent_id INTEGER,
     title TEXT NOT NULL,
@@ -11,4 +8,3 @@ CREATE TABLE task(
     FOREIGN KEY (parent_id) REFERENCES task (id)
 
 );
-
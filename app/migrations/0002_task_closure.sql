@@ -0,0 +1,54 @@
+-- every (ancestor, descendant) pair of the task tree, including the task
+-- itself with depth 0. Kept in sync with task by the triggers below.
+CREATE TABLE IF NOT EXISTS task_closure(
+    ancestor INTEGER NOT NULL,
+    descendant INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    PRIMARY KEY (ancestor, descendant)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_task_closure_descendant ON task_closure (descendant, depth);
+
+CREATE TRIGGER IF NOT EXISTS task_closure_insert AFTER INSERT ON task
+BEGIN
+    INSERT INTO task_closure (ancestor, descendant, depth)
+    SELECT ancestor, NEW.id, depth + 1
+    FROM task_closure
+    WHERE descendant = NEW.parent_id
+    UNION ALL
+    SELECT NEW.id, NEW.id, 0;
+END;
+
+-- move the whole subtree: unlink it from the old ancestors,
+-- then link it under every ancestor of the new parent.
+CREATE TRIGGER IF NOT EXISTS task_closure_reparent AFTER UPDATE OF parent_id ON task
+WHEN OLD.parent_id IS NOT NEW.parent_id
+BEGIN
+    DELETE FROM task_closure
+    WHERE descendant IN (SELECT descendant FROM task_closure
+                         WHERE ancestor = NEW.id)
+    AND ancestor NOT IN (SELECT descendant FROM task_closure
+                         WHERE ancestor = NEW.id);
+    INSERT INTO task_closure (ancestor, descendant, depth)
+    SELECT p.ancestor, c.descendant, p.depth + c.depth + 1
+    FROM task_closure p, task_closure c
+    WHERE p.descendant = NEW.parent_id AND c.ancestor = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS task_closure_delete AFTER DELETE ON task
+BEGIN
+    DELETE FROM task_closure
+    WHERE descendant = OLD.id OR ancestor = OLD.id;
+END;
+
+-- backfill tasks that existed before the closure table
+INSERT OR IGNORE INTO task_closure (ancestor, descendant, depth)
+WITH RECURSIVE closure(ancestor, descendant, depth) AS (
+    SELECT id, id, 0 FROM task
+    UNION ALL
+    SELECT c.ancestor, t.id, c.depth + 1
+    FROM closure c
+    INNER JOIN task t ON t.parent_id = c.descendant
+    WHERE c.depth < (SELECT COUNT(*) FROM task)
+)
+SELECT ancestor, descendant, depth FROM closure;
@@ -0,0 +1,3 @@
+CREATE INDEX IF NOT EXISTS idx_task_parent_id ON task (parent_id);
+CREATE INDEX IF NOT EXISTS idx_task_status ON task (status);
+CREATE INDEX IF NOT EXISTS idx_task_completed_date ON task (completed_date);
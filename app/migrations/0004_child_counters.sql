@@ -0,0 +1,48 @@
+-- number of direct children per status, used to derive the parent status
+ALTER TABLE task ADD COLUMN empty_children INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE task ADD COLUMN half_children INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE task ADD COLUMN full_children INTEGER NOT NULL DEFAULT 0;
+
+UPDATE task SET
+    empty_children = (SELECT COUNT(*) FROM task c
+                      WHERE c.parent_id = task.id AND c.status = 'EMPTY'),
+    half_children = (SELECT COUNT(*) FROM task c
+                     WHERE c.parent_id = task.id AND c.status = 'HALF'),
+    full_children = (SELECT COUNT(*) FROM task c
+                     WHERE c.parent_id = task.id AND c.status = 'FULL');
+
+CREATE TRIGGER IF NOT EXISTS task_counters_insert AFTER INSERT ON task
+WHEN NEW.parent_id IS NOT NULL
+BEGIN
+    UPDATE task SET
+        empty_children = empty_children + (NEW.status = 'EMPTY'),
+        half_children = half_children + (NEW.status = 'HALF'),
+        full_children = full_children + (NEW.status = 'FULL')
+    WHERE id = NEW.parent_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS task_counters_update
+AFTER UPDATE OF status, parent_id ON task
+WHEN OLD.status IS NOT NEW.status OR OLD.parent_id IS NOT NEW.parent_id
+BEGIN
+    UPDATE task SET
+        empty_children = empty_children - (OLD.status = 'EMPTY'),
+        half_children = half_children - (OLD.status = 'HALF'),
+        full_children = full_children - (OLD.status = 'FULL')
+    WHERE id = OLD.parent_id;
+    UPDATE task SET
+        empty_children = empty_children + (NEW.status = 'EMPTY'),
+        half_children = half_children + (NEW.status = 'HALF'),
+        full_children = full_children + (NEW.status = 'FULL')
+    WHERE id = NEW.parent_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS task_counters_delete AFTER DELETE ON task
+WHEN OLD.parent_id IS NOT NULL
+BEGIN
+    UPDATE task SET
+        empty_children = empty_children - (OLD.status = 'EMPTY'),
+        half_children = half_children - (OLD.status = 'HALF'),
+        full_children = full_children - (OLD.status = 'FULL')
+    WHERE id = OLD.parent_id;
+END;
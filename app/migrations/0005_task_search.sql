@@ -0,0 +1,24 @@
+-- full text index over task titles, kept in sync by the triggers below
+CREATE VIRTUAL TABLE IF NOT EXISTS task_fts USING fts5(
+    title, content='task', content_rowid='id'
+);
+
+INSERT INTO task_fts (task_fts) VALUES ('rebuild');
+
+CREATE TRIGGER IF NOT EXISTS task_fts_insert AFTER INSERT ON task
+BEGIN
+    INSERT INTO task_fts (rowid, title) VALUES (NEW.id, NEW.title);
+END;
+
+CREATE TRIGGER IF NOT EXISTS task_fts_update AFTER UPDATE OF title ON task
+BEGIN
+    INSERT INTO task_fts (task_fts, rowid, title)
+    VALUES ('delete', OLD.id, OLD.title);
+    INSERT INTO task_fts (rowid, title) VALUES (NEW.id, NEW.title);
+END;
+
+CREATE TRIGGER IF NOT EXISTS task_fts_delete AFTER DELETE ON task
+BEGIN
+    INSERT INTO task_fts (task_fts, rowid, title)
+    VALUES ('delete', OLD.id, OLD.title);
+END;
@@ -0,0 +1,2 @@
+-- case insensitive title index for prefix search (LIKE 'abc%')
+CREATE INDEX IF NOT EXISTS idx_task_title ON task (title COLLATE NOCASE);
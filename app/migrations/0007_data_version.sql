@@ -0,0 +1,25 @@
+-- version of the task data, bumped by every write to task (from any
+-- process or connection). epoch is new for every new database file so
+-- versions of a recreated database never match the old ones.
+CREATE TABLE IF NOT EXISTS data_version(
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    epoch TEXT NOT NULL DEFAULT (lower(hex(randomblob(4)))),
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO data_version (id) VALUES (1);
+
+CREATE TRIGGER IF NOT EXISTS data_version_insert AFTER INSERT ON task
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_update AFTER UPDATE ON task
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_delete AFTER DELETE ON task
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
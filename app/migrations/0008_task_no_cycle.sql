@@ -0,0 +1,10 @@
+-- a task can't be moved under itself or one of its sub tasks. Checked
+-- inside the writing transaction, so concurrent moves (A under B and
+-- B under A) can't both pass and create a cycle.
+CREATE TRIGGER IF NOT EXISTS task_no_cycle BEFORE UPDATE OF parent_id ON task
+WHEN NEW.parent_id IS NOT NULL AND EXISTS (
+    SELECT 1 FROM task_closure
+    WHERE ancestor = NEW.id AND descendant = NEW.parent_id)
+BEGIN
+    SELECT RAISE(ABORT, 'task cycle');
+END;
@@ -1,15 +1,33 @@
 from flask import (
-    Blueprint, request, redirect, Response, flash)
-from .db import get_db
-from sqlite3 import Row
-from typing import Literal
-from .utils import build_response
+    Blueprint, request, redirect, Response, flash, stream_with_context,
+    current_app, send_from_directory)
+from .db import get_db, db_cli
+from sqlite3 import Row, Connection
+from typing import Literal, Iterator, IO
+from pathlib import Path
+from .utils import build_response, conditional_get, build_trees
+from .cache import cached, invalidate, get_cache
+from .metrics import get_metrics
+from . import profiler
+import click
+import csv
+import io
+import json
+import re
 
 
 bp = Blueprint('api', __name__, url_prefix="/api/v1")
 
+NDJSON = 'application/x-ndjson'
+EXPORT_FORMATS = {'csv': 'text/csv', 'json': 'application/json'}
+# triggers replaced by index_new_tasks for batches of BULK_INSERT_MIN_ROWS
+INSERT_TRIGGERS = ['task_closure_insert', 'task_counters_insert',
+                   'task_fts_insert', 'data_version_insert']
+BULK_INSERT_MIN_ROWS = 1000
+
 
 @bp.route('/tasks', methods=['GET', 'POST', 'PATCH', 'DELETE'])
+@conditional_get
 def task_by_id() -> Response:
     '''
     Description
@@ -18,34 +36,98 @@ def task_by_id() -> Response:
 
     POST method can accept data from request data or html form.
 
+    GET responses carry an ETag of the data version,
+    a matching If-None-Match header returns 304.
+
     Accept url params
     ---------------
     id: int
-    mode: ['tree', 'single', 'all'] (Only used in GET)
+    mode: ['tree', 'single', 'all', 'children', 'nested'] (Only used in GET)
+    max_depth: int, maximum Level returned (Only used in tree, all, nested)
     filter: status options in db ['empty', 'half', 'full'] (Only used in GET)
+    multiple statuses are separated by commas, i.e. filter=half,empty
+    ids: comma separated task ids, i.e. ids=1,5,9 (Only used in GET)
+    lineage: ['true', 'false'] add lineage to filtered tasks (Only used in GET)
+    cascade: ['true', 'false'] delete all sub tasks too (Only used in DELETE)
+    after_id: int, only return tasks with a larger id (mode all and filter)
+    limit: int, maximum number of tasks returned (mode all and filter)
+    format: ['json', 'ndjson'] stream one task per line (mode all and filter)
+    (ndjson is also used if the Accept header prefers application/x-ndjson)
     '''
     id = request.args.get('id', default=None, type=int)
     mode = request.args.get('mode', default='', type=str).lower()
     filter = request.args.get('filter', default='', type=str).lower()
+    lineage = request.args.get('lineage', default='', type=str).lower()
+    cascade = request.args.get('cascade', default='', type=str).lower()
+    after_id = request.args.get('after_id', default=None, type=int)
+    limit = request.args.get('limit', default=None, type=int)
+    max_depth = request.args.get('max_depth', default=None, type=int)
+    ids = request.args.get('ids', default=None, type=str)
+    format = request.args.get('format', default='', type=str).lower()
+    if not format and request.accept_mimetypes.best_match(
+            ['application/json', NDJSON]) == NDJSON:
+        format = 'ndjson'
 
-    if id is not None:
-        if request.method == 'GET':
+    if request.method == 'GET':
+        if limit is not None and limit <= 0:
+            return build_response(
+                {'error': 'Limit has to be a positive integer.'}, 400)
+        if max_depth is not None and max_depth <= 0:
+            return build_response(
+                {'error': 'Max_depth has to be a positive integer.'}, 400)
+        if ids is not None:
+            try:
+                ids = [int(id) for id in ids.split(',') if id.strip()]
+            except ValueError:
+                return build_response(
+                    {'error': 'Ids have to be integers.'}, 400)
+
+            def build():
+                result, status_code = get_tasks(ids)
+                if lineage == 'true':
+                    add_lineage(result['tasks'])
+                return result, status_code
+            result, status_code = cached(
+                ('get_tasks', tuple(ids), lineage), build)
+            return build_response(result, status_code)
+        if format == 'ndjson':
+            if mode == 'all':
+                sql, params = all_tasks_query(after_id, limit, max_depth)
+            elif mode == '' and id is None:
+                sql, params = filter_query(filter, after_id, limit)
+            else:
+                return build_response(
+                    {'error': 'Only mode all and filter can be streamed.'},
+                    400)
+            return stream_tasks(sql, params)
+        if mode in ('all', 'children', 'nested') or id is not None:
             if mode == '':
                 mode = 'tree'
-            result, status_code = get_task(id, mode)
+            result, status_code = cached(
+                ('get_task', id, mode, after_id, limit, max_depth),
+                lambda: get_task(id, mode, after_id=after_id, limit=limit,
+                                 max_depth=max_depth))
             return build_response(result, status_code)
 
+    if id is not None:
         if request.method == 'PATCH':
             data = request.json
             result, status_code = patch_task(id, data)
             return build_response(result, status_code)
 
         elif request.method == 'DELETE':
-            result, status_code = delete_task(id)
+            result, status_code = delete_task(id, cascade=cascade == 'true')
             return build_response(result, status_code)
 
     if request.method == 'GET':
-        result, status_code = filter_task(filter)
+        def build():
+            result, status_code = filter_task(filter, after_id=after_id,
+                                              limit=limit)
+            if lineage == 'true' and status_code == 200:
+                add_lineage(result['tasks'])
+            return result, status_code
+        result, status_code = cached(
+            ('filter_task', filter, lineage, after_id, limit), build)
         return build_response(result, status_code)
 
     elif request.method == 'POST':
@@ -77,25 +159,273 @@ def task_by_id() -> Response:
     return build_response({}, 400)
 
 
-def get_task(id: int, mode: Literal['tree', 'single', 'all'] = 'tree'
-             ) -> tuple[dict, int]:
+@bp.route('/cache')
+def cache_stats() -> Response:
+    '''
+    Description
+    -----------
+    Return the data version, size and hit/miss counters
+    of the task view cache.
+    '''
+    return build_response(get_cache().stats())
+
+
+@bp.route('/metrics')
+def metrics() -> Response:
+    '''
+    Description
+    -----------
+    Per endpoint request and sql metrics and the task view cache
+    counters in the Prometheus text format.
+    '''
+    registry = get_metrics()
+    if registry is None:
+        return build_response({'error': 'Metrics are disabled.'}, 404)
+    return Response(registry.render(get_cache().stats()),
+                    mimetype='text/plain; version=0.0.4')
+
+
+@bp.route('/profiles')
+def profiles() -> Response:
+    '''
+    Description
+    -----------
+    List the recent request profiles (newest first), see
+    profiler.RequestProfiler. Only available to the PROFILER_ALLOWED
+    client addresses when PROFILER is enabled.
+
+    Accept url params
+    ---------------
+    limit: int, maximum number of profiles returned. Default 20
+    '''
+    if not profiler.is_allowed(request.remote_addr):
+        return build_response({'error': 'Profiler is disabled.'}, 404)
+    limit = request.args.get('limit', default=20, type=int)
+    paths = profiler.list_profiles(profiler.get_folder())[:max(limit, 0)]
+    return build_response(
+        {'profiles': [profiler.describe_profile(path) for path in paths]})
+
+
+@bp.route('/profiles/<name>')
+def profile_file(name: str) -> Response:
+    '''
+    Description
+    -----------
+    Download a .pstats file (open with python -m pstats <file>).
+    '''
+    if not profiler.is_allowed(request.remote_addr):
+        return build_response({'error': 'Profiler is disabled.'}, 404)
+    return send_from_directory(profiler.get_folder(), name,
+                               as_attachment=True)
+
+
+@bp.route('/tasks/bulk', methods=['POST'])
+def bulk_tasks() -> Response:
+    '''
+    Description
+    -----------
+    Insert many tasks in one transaction. See post_tasks for the format.
+
+    Accept request json
+    ---------------
+    tasks: list of flat or nested tasks.
+    (the list can also be sent directly as the request json)
+    '''
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('tasks')
+    if not isinstance(data, list):
+        return build_response({'error': 'Bad data for bulk request.'}, 400)
+    result, status_code = post_tasks(data)
+    return build_response(result, status_code)
+
+
+@bp.route('/tasks/status', methods=['PATCH'])
+def bulk_status() -> Response:
+    '''
+    Description
+    -----------
+    Set the status of many tasks with one update. See patch_status.
+
+    Accept request json
+    ---------------
+    status: status options in db ['empty', 'half', 'full']
+    ids: list of task ids
+    root: id of a task, the task and all its sub tasks are updated.
+    '''
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return build_response({'error': 'Bad data for status request.'},
+                              400)
+    result, status_code = patch_status(data.get('status'),
+                                       ids=data.get('ids'),
+                                       root=data.get('root'))
+    return build_response(result, status_code)
+
+
+@bp.route('/tasks/stats')
+@conditional_get
+def task_stats() -> Response:
+    '''
+    Description
+    -----------
+    Return status totals for every subtree. See get_stats.
+
+    Accept url params
+    ---------------
+    id: int, only the subtrees under this task (all tasks if missing)
+    '''
+    id = request.args.get('id', default=None, type=int)
+    result, status_code = cached(('get_stats', id), lambda: get_stats(id))
+    return build_response(result, status_code)
+
+
+@bp.route('/tasks/search')
+@conditional_get
+def task_search() -> Response:
+    '''
+    Description
+    -----------
+    Full text search on task titles. See search_tasks.
+
+    Accept url params
+    ---------------
+    q: str, the words to search for
+    limit: int, maximum number of tasks returned. Default 20
+    '''
+    q = request.args.get('q', default='', type=str)
+    limit = request.args.get('limit', default=20, type=int)
+    result, status_code = cached(('search_tasks', q, limit),
+                                 lambda: search_tasks(q, limit))
+    return build_response(result, status_code)
+
+
+@bp.route('/tasks/parents')
+@conditional_get
+def parent_options() -> Response:
     '''
     Description
     -----------
-    tree: recursively return all the subtasks that belong to the main id.
+    Parent task candidates for a typeahead input. See search_parents.
+
+    Accept url params
+    ---------------
+    q: str, start of the title
+    id: int, the task to find a parent for (its sub tasks are excluded)
+    limit: int, maximum number of tasks returned. Default 10
+    '''
+    q = request.args.get('q', default='', type=str)
+    id = request.args.get('id', default=None, type=int)
+    limit = request.args.get('limit', default=10, type=int)
+    result, status_code = cached(('search_parents', q, id, limit),
+                                 lambda: search_parents(q, id, limit))
+    return build_response(result, status_code)
+
+
+@bp.route('/export')
+@conditional_get
+def export() -> Response:
+    '''
+    Description
+    -----------
+    Download a whole project (or every project) as a file.
+    Rows are streamed from the database cursor, see export_query.
+
+    Accept url params
+    ---------------
+    format: ['csv', 'json']. Default csv
+    root: int, the root task of the project. Default all projects
+    '''
+    format = request.args.get('format', default='csv', type=str).lower()
+    root = request.args.get('root', default=None, type=int)
+    if format not in EXPORT_FORMATS:
+        return build_response({'error': 'Bad format.'}, 400)
+    if root is not None and get_db().execute(
+            'SELECT 1 FROM task WHERE id = ?', (root,)).fetchone() is None:
+        return build_response({'error': 'Id does not exist.'}, 400)
+    sql, params = export_query(root)
+    rows = iter_csv(sql, params) if format == 'csv' else \
+        iter_json(sql, params)
+    filename = f'tasks_{root}.{format}' if root else f'tasks.{format}'
+    return Response(
+        stream_with_context(rows), mimetype=EXPORT_FORMATS[format],
+        headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+@bp.route('/import', methods=['POST'])
+def import_file() -> Response:
+    '''
+    Description
+    -----------
+    Load a file made by /export (see import_tasks).
+    The file is sent as the request body or as the form field file.
+
+    Accept url params
+    ---------------
+    format: ['csv', 'json']. Default from the file name or content type
+    parent: int, existing task the imported projects are added under
+    '''
+    file = request.files.get('file')
+    name = file.filename if file else ''
+    mimetype = file.mimetype if file else request.mimetype
+    format = request.args.get('format', default='', type=str).lower() or (
+        'csv' if name.endswith('.csv') or mimetype == 'text/csv'
+        else 'json')
+    parent = request.args.get('parent', default=None, type=int)
+    if format not in EXPORT_FORMATS:
+        return build_response({'error': 'Bad format.'}, 400)
+    data = file.read() if file else request.get_data()
+    try:
+        tasks = read_tasks(io.StringIO(data.decode('utf-8-sig')), format)
+    except (ValueError, UnicodeDecodeError):
+        return build_response({'error': 'Bad data for import request.'},
+                              400)
+    result, status_code = import_tasks(tasks, parent)
+    return build_response(result, status_code)
+
+
+def get_task(id: int,
+             mode: Literal['tree', 'single', 'all', 'children',
+                           'nested'] = 'tree',
+             after_id: int | None = None, limit: int | None = None,
+             max_depth: int | None = None) -> tuple[dict, int]:
+    '''
+    Description
+    -----------
+    tree: return all the subtasks that belong to the main id.
 
     single: return only the information of that task id.
 
-    all: recursively return all task labeled with task levels
+    all: return all task labeled with task levels
+
+    children: return only the direct children of the main id
+    (the root tasks if id is None) with the number of children
+    they have in each status. Used to expand a tree level by level.
+
+    nested: return the tree of the main id (all trees if id is None)
+    already nested, sub tasks are listed under the sub_tasks key.
+
+    Tree and all mode read the subtasks from the task_closure table.
 
     Parameters
     ---------
     id: int
     Id of the main task to query
 
-    mode: ['tree', 'single', 'all']
+    mode: ['tree', 'single', 'all', 'children', 'nested']
     Default to tree mode.
 
+    max_depth: int
+    only return tasks up to this Level. (Not used in single and children)
+
+    after_id: int
+    only return tasks with a larger id. (Only used in all mode)
+
+    limit: int
+    maximum number of tasks to return. (Only used in all mode)
+    With a limit, next_after_id is added to the result. Pass it as
+    after_id to get the next page, None means there are no more pages.
+
     Returns
     --------
     result: dict
@@ -107,16 +437,31 @@ def get_task(id: int, mode: Literal['tree', 'single', 'all'] = 'tree'
     if mode == 'tree':
         data = db.execute(
             '''
-            WITH RECURSIVE TaskTree AS (
-            SELECT id, title, parent_id, status, 1 AS Level
+            SELECT t.id, t.title, t.parent_id, t.status,
+            c.depth + 1 AS Level
+            FROM task_closure c
+            INNER JOIN task t ON t.id = c.descendant
+            WHERE c.ancestor = ? AND (? IS NULL OR c.depth < ?)
+            ORDER BY c.depth, t.id;
+            ''', (id, max_depth, max_depth)).fetchall()
+        return {'tasks': RowsToList(data)}, 200
+
+    elif mode == 'nested':
+        if id is None:
+            result, status_code = get_task(None, 'all', max_depth=max_depth)
+        else:
+            result, status_code = get_task(id, 'tree', max_depth=max_depth)
+        return {'tasks': build_trees(result['tasks'])}, status_code
+
+    elif mode == 'children':
+        data = db.execute(
+            '''
+            SELECT id, title, parent_id, status,
+            empty_children + half_children + full_children AS child_count,
+            empty_children, half_children, full_children
             FROM task
-            WHERE id = ?
-            UNION ALL
-            SELECT t.id, t.title, t.parent_id, t.status, tt.Level + 1
-            FROM task t
-            INNER JOIN TaskTree tt ON t.parent_id = tt.id
-            )
-            SELECT * FROM TaskTree;
+            WHERE parent_id IS ?
+            ORDER BY id
             ''', (id,)).fetchall()
         return {'tasks': RowsToList(data)}, 200
 
@@ -131,24 +476,366 @@ def get_task(id: int, mode: Literal['tree', 'single', 'all'] = 'tree'
 
     elif mode == 'all':
         data = db.execute(
-            '''
-            WITH RECURSIVE TaskTree AS (
-            SELECT id, title, parent_id, status, 1 AS Level
+            *all_tasks_query(after_id, limit, max_depth)).fetchall()
+        return paginate(RowsToList(data), limit), 200
+    return {'error': 'Bad mode.'}, 400
+
+
+def all_tasks_query(after_id: int | None = None, limit: int | None = None,
+                    max_depth: int | None = None) -> tuple[str, tuple]:
+    '''
+    Description
+    -----------
+    Build the query of get_task all mode, ordered by id
+    and starting after after_id (keyset pagination).
+
+    Parameters
+    ---------
+    after_id: int
+    only return tasks with a larger id.
+
+    limit: int
+    maximum number of tasks to return. None for no limit.
+
+    max_depth: int
+    only return tasks up to this Level. None for no limit.
+
+    Returns
+    --------
+    sql: str
+    params: tuple
+    '''
+    # driven from task in rowid order, so a page reads only its own
+    # rows (no sort), Level is the depth below the root task + 1
+    sql = '''
+        SELECT t.id, t.title, t.parent_id, t.status,
+        (SELECT MAX(depth) FROM task_closure
+         WHERE descendant = t.id) + 1 AS Level
+        FROM task t
+        WHERE t.id > ? AND (? IS NULL OR Level <= ?)
+        ORDER BY t.id
+        LIMIT ?;
+        '''
+    return sql, (after_id or 0, max_depth, max_depth,
+                 -1 if limit is None else limit)
+
+
+def filter_query(filter: str, after_id: int | None = None,
+                 limit: int | None = None) -> tuple[str, tuple]:
+    '''
+    Description
+    -----------
+    Build the query of filter_task, ordered by id
+    and starting after after_id (keyset pagination).
+
+    Parameters
+    ---------
+    filter: str
+    ['EMPTY','HALF','FULL'] (case insensitive)
+    Several statuses can be separated by commas, i.e. 'half,empty'
+
+    after_id: int
+    only return tasks with a larger id.
+
+    limit: int
+    maximum number of tasks to return. None for no limit.
+
+    Returns
+    --------
+    sql: str
+    params: tuple
+    '''
+    statuses = [status.strip().upper() for status in filter.split(',')]
+    sql = '''
+        SELECT id, title, parent_id, status
+        FROM task
+        WHERE status IN (SELECT value FROM json_each(?)) AND id > ?
+        ORDER BY id
+        LIMIT ?;
+        '''
+    return sql, (json.dumps(statuses), after_id or 0,
+                 -1 if limit is None else limit)
+
+
+def paginate(tasks: list[dict], limit: int | None) -> dict:
+    '''
+    Description
+    -----------
+    Wrap a page of tasks into the result dictionary.
+    If a limit is used, next_after_id is the id to continue from
+    (None if this is the last page).
+
+    Parameters
+    ---------
+    tasks: list[dict]
+    tasks ordered by id.
+
+    limit: int
+    the limit used in the query.
+
+    Returns
+    --------
+    result: dict
+    '''
+    result = {'tasks': tasks}
+    if limit is not None:
+        result['next_after_id'] = \
+            tasks[-1]['id'] if len(tasks) == limit else None
+    return result
+
+
+def stream_tasks(sql: str, params: tuple) -> Response:
+    '''
+    Description
+    -----------
+    Stream the rows of a query as newline delimited json.
+    Rows are read from the cursor one at a time, so memory usage
+    doesn't depend on the number of tasks.
+
+    Parameters
+    ---------
+    sql: str
+    params: tuple
+
+    Returns
+    --------
+    Response: flask.Response
+    '''
+    return Response(stream_with_context(iter_ndjson(sql, params)),
+                    mimetype=NDJSON)
+
+
+def iter_ndjson(sql: str, params: tuple) -> Iterator[str]:
+    '''
+    Description
+    -----------
+    Yield each row of the query as one line of json.
+
+    Parameters
+    ---------
+    sql: str
+    params: tuple
+
+    Returns
+    --------
+    lines: Iterator[str]
+    '''
+    for row in get_db().execute(sql, params):
+        yield json.dumps(dict(row)) + '\n'
+
+
+def export_query(root: int | None = None) -> tuple[str, tuple]:
+    '''
+    Description
+    -----------
+    Build the query of an export. Every task is returned with its depth
+    (0 for the root) and lineage (titles from the root down to the
+    parent task, separated by >>).
+
+    Tasks are walked depth first from the root(s), so a parent task
+    is always returned before its sub tasks. The root of a single
+    project export is returned without parent_id.
+
+    Parameters
+    ---------
+    root: int
+    root task of the exported project. Default None (all projects)
+
+    Returns
+    --------
+    sql: str
+    params: tuple
+    '''
+    sql = f'''
+        WITH RECURSIVE export(id, parent_id, title, status, depth, lineage,
+                              created, completed_date) AS (
+            SELECT id, NULL, title, status, 0, '', created, completed_date
             FROM task
-            where parent_id is null
+            WHERE {'parent_id IS NULL' if root is None else 'id = ?'}
             UNION ALL
-            SELECT t.id, t.title, t.parent_id, t.status, tt.Level + 1
+            SELECT t.id, t.parent_id, t.title, t.status, e.depth + 1,
+            CASE WHEN e.depth = 0 THEN e.title
+                 ELSE e.lineage || ' >> ' || e.title END,
+            t.created, t.completed_date
             FROM task t
-            INNER JOIN TaskTree tt ON t.parent_id = tt.id
-            )
-            SELECT * FROM TaskTree
-            ORDER BY id;
-            ''').fetchall()
-        return {'tasks': RowsToList(data)}, 200
-    return {'error': 'Bad mode.'}, 400
+            INNER JOIN export e ON t.parent_id = e.id
+            -- deepest rows first: walks the trees depth first
+            ORDER BY 5 DESC
+        )
+        SELECT * FROM export;
+        '''
+    return sql, () if root is None else (root,)
+
+
+def iter_csv(sql: str, params: tuple) -> Iterator[str]:
+    '''
+    Description
+    -----------
+    Yield a header line and one csv line for each row of the query.
+
+    Parameters
+    ---------
+    sql: str
+    params: tuple
+
+    Returns
+    --------
+    lines: Iterator[str]
+    '''
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    cursor = get_db().execute(sql, params)
+    writer.writerow([column[0] for column in cursor.description])
+    for row in cursor:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # header only, when the query returns nothing
+    yield buffer.getvalue()
+
+
+def iter_json(sql: str, params: tuple) -> Iterator[str]:
+    '''
+    Description
+    -----------
+    Yield the rows of the query as the items of one json list.
+
+    Parameters
+    ---------
+    sql: str
+    params: tuple
+
+    Returns
+    --------
+    chunks: Iterator[str]
+    '''
+    separator = '[\n'
+    for row in get_db().execute(sql, params):
+        yield separator + json.dumps(dict(row))
+        separator = ',\n'
+    yield '[]\n' if separator == '[\n' else '\n]\n'
+
+
+def get_tasks(ids: list[int]) -> tuple[dict, int]:
+    '''
+    Description
+    -----------
+    Query several tasks by id with one query.
+    The ids are bound as a single json parameter,
+    so the number of ids is not limited by sqlite's variable limit.
+
+    Parameters
+    ---------
+    ids: list[int]
+
+    Returns
+    --------
+    result: dict
+    status_code: int
+    Return the queried tasks (ordered by id) in a dictionary with
+    key tasks. Ids that don't exist are left out.
+    '''
+    db = get_db()
+    data = db.execute(
+        '''
+        SELECT id, title, parent_id, status
+        FROM task
+        WHERE id IN (SELECT value FROM json_each(?))
+        ORDER BY id
+        ''', (json.dumps(ids),)).fetchall()
+    return {'tasks': RowsToList(data)}, 200
+
+
+def get_stats(id: int | None = None) -> tuple[dict, int]:
+    '''
+    Description
+    -----------
+    Count the tasks in each status for the subtree of every task
+    (the task itself and all its sub tasks).
+    All subtrees are counted with one aggregation over task_closure.
+
+    Parameters
+    ---------
+    id: int
+    only return the subtrees of this task and its sub tasks.
+    Default None, return the subtrees of all tasks.
+
+    Returns
+    --------
+    result: dict
+    status_code: int
+    Dictionary with key stats and value being a list of
+    {'id', 'total', 'empty', 'half', 'full'} ordered by id.
+    '''
+    db = get_db()
+    # separate statements so the subtree query can use the index
+    if id is None:
+        where, params = '', ()
+    else:
+        where = '''WHERE c.ancestor IN (SELECT descendant FROM task_closure
+                                        WHERE ancestor = ?)'''
+        params = (id,)
+    data = db.execute(
+        f'''
+        SELECT c.ancestor AS id, COUNT(*) AS total,
+        SUM(t.status = 'EMPTY') AS empty,
+        SUM(t.status = 'HALF') AS half,
+        SUM(t.status = 'FULL') AS full
+        FROM task_closure c
+        INNER JOIN task t ON t.id = c.descendant
+        {where}
+        GROUP BY c.ancestor
+        ORDER BY c.ancestor;
+        ''', params).fetchall()
+    return {'stats': RowsToList(data)}, 200
+
+
+def search_tasks(q: str, limit: int = 20) -> tuple[dict, int]:
+    '''
+    Description
+    -----------
+    Search task titles with the task_fts full text index.
+    Every word of q has to match the start of a word in the title,
+    i.e. 'fin wa' matches 'Buy finishing wax'.
+    Results are ranked by relevance and include their lineage.
+
+    Parameters
+    ---------
+    q: str
+    the words to search for.
+
+    limit: int. Default 20
+    maximum number of tasks to return.
+
+    Returns
+    --------
+    result: dict
+    status_code: int
+    Return the matching tasks in a dictionary with key tasks.
+    '''
+    words = re.findall(r'\w+', q)
+    if not words:
+        return {'error': 'Missing search query.'}, 400
+    if limit <= 0:
+        return {'error': 'Limit has to be a positive integer.'}, 400
+    # quote every word so user input can't use the fts query syntax
+    query = ' '.join(f'"{word}"*' for word in words)
+    db = get_db()
+    data = db.execute(
+        '''
+        SELECT t.id, t.title, t.parent_id, t.status
+        FROM task_fts f
+        INNER JOIN task t ON t.id = f.rowid
+        WHERE task_fts MATCH ?
+        ORDER BY f.rank
+        LIMIT ?;
+        ''', (query, limit)).fetchall()
+    return {'tasks': add_lineage(RowsToList(data))}, 200
 
 
-def filter_task(filter: Literal['EMPTY', 'HALF', 'FULL']
+def filter_task(filter: Literal['EMPTY', 'HALF', 'FULL'],
+                after_id: int | None = None, limit: int | None = None
                 ) -> tuple[dict, int]:
     '''
     Description
@@ -159,7 +846,15 @@ def filter_task(filter: Literal['EMPTY', 'HALF', 'FULL']
     ---------
     filter: str
 
-    ['EMPTY','HALF','FULL']
+    ['EMPTY','HALF','FULL'] (case insensitive)
+    Several statuses can be separated by commas, i.e. 'half,empty'
+
+    after_id: int
+    only return tasks with a larger id.
+
+    limit: int
+    maximum number of tasks to return.
+    With a limit, next_after_id is added to the result.
 
     Returns
     --------
@@ -168,13 +863,8 @@ def filter_task(filter: Literal['EMPTY', 'HALF', 'FULL']
     Return the queried tasks in a dictionary with key tasks.
     '''
     db = get_db()
-    data = db.execute(
-        '''
-    SELECT id, title, parent_id, status
-    FROM task
-    WHERE status = ?
-    ''', (filter,)).fetchall()
-    return {'tasks': RowsToList(data)}, 200
+    data = db.execute(*filter_query(filter, after_id, limit)).fetchall()
+    return paginate(RowsToList(data), limit), 200
 
 
 def post_task(data: dict[str, str | int]) -> tuple[dict, int]:
@@ -216,7 +906,9 @@ def post_task(data: dict[str, str | int]) -> tuple[dict, int]:
                         VALUES (?,?)''',
                               (data['title'], data['parent_id']))
             id = resp.lastrowid
+            rollup_status(db, [data['parent_id']])
             db.commit()
+            invalidate()
         except db.IntegrityError:
             return {'error': 'Bad parent id.'}, 400
         data = db.execute(
@@ -227,13 +919,407 @@ def post_task(data: dict[str, str | int]) -> tuple[dict, int]:
     return {'error': error}, 400
 
 
+def post_tasks(tasks: list[dict]) -> tuple[dict, int]:
+    '''
+    Description
+    -----------
+    Insert a list of tasks (and their sub tasks) in one transaction.
+
+    Tasks can be sent as a flat list, where id is a temporary id
+    chosen by the client, parent_ref refers to the temporary id of
+    another task in the list and parent_id to an existing task.
+
+    Or as nested trees (the format of todo.tasks_to_trees), where the
+    tasks under sub_tasks are children of the task they are listed in
+    (they can't have a parent_ref or parent_id).
+
+    Temporary ids are compared as strings (1 and '1' are the same id).
+
+    Parameters
+    ---------
+    tasks: list[dict]
+    Each task includes title (required), id, parent_ref or parent_id,
+    status and sub_tasks (optional)
+
+    Returns
+    --------
+    result: dict
+    status_code: int
+    Dictionary with key ids and value being a dictionary that maps
+    the temporary ids (as strings) to the ids of the inserted tasks.
+    '''
+    rows = []
+
+    def flatten(items, parent_ref):
+        for item in items:
+            if not isinstance(item, dict):
+                raise ValueError('Bad task data.')
+            if not is_ref(item.get('id')):
+                raise ValueError('Bad task id.')
+            if not is_ref(item.get('parent_id')) or \
+                    not is_ref(item.get('parent_ref')):
+                raise ValueError('Bad parent id.')
+            has_parent = item.get('parent_id') is not None or \
+                item.get('parent_ref') is not None
+            if parent_ref is not None and has_parent:
+                raise ValueError('Sub tasks cannot have a parent_id '
+                                 'or parent_ref.')
+            if item.get('parent_id') is not None and \
+                    item.get('parent_ref') is not None:
+                raise ValueError('Use either parent_id or parent_ref.')
+            ref = object() if item.get('id') is None else str(item['id'])
+            row_parent_ref = parent_ref
+            if item.get('parent_ref') is not None:
+                row_parent_ref = str(item['parent_ref'])
+            rows.append({'ref': ref, 'parent_ref': row_parent_ref,
+                         'parent_id': item.get('parent_id'),
+                         'title': item.get('title'),
+                         'status': item.get('status')})
+            sub_tasks = item.get('sub_tasks') or []
+            if not isinstance(sub_tasks, list):
+                raise ValueError('Bad task data.')
+            flatten(sub_tasks, ref)
+
+    try:
+        flatten(tasks, None)
+        ids = insert_task_rows(get_db(), rows)
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    return {'ids': {ref: id for ref, id in ids.items()
+                    if isinstance(ref, str)}}, 200
+
+
+def read_tasks(file: IO[str], format: str) -> list[dict]:
+    '''
+    Description
+    -----------
+    Read the tasks of an export file. Empty csv fields are read as None.
+
+    Parameters
+    ---------
+    file: IO[str]
+    text file object.
+
+    format: ['csv', 'json']
+
+    Returns
+    --------
+    tasks: list[dict]
+    Raise ValueError if the file can't be read.
+    '''
+    if format == 'csv':
+        return [{key: value if value != '' else None
+                 for key, value in row.items()}
+                for row in csv.DictReader(file)]
+    tasks = json.load(file)
+    if isinstance(tasks, dict):
+        tasks = tasks.get('tasks')
+    if not isinstance(tasks, list):
+        raise ValueError('Bad task data.')
+    return tasks
+
+
+def import_tasks(tasks: list[dict], parent_id: int | None = None
+                 ) -> tuple[dict, int]:
+    '''
+    Description
+    -----------
+    Insert the tasks of an export (see export_query) in one transaction.
+    The ids of the file are remapped to new ids and parent_id refers to
+    the id of another task in the file, so projects can be moved
+    between databases. depth and lineage are ignored.
+
+    The whole file is checked before anything is written, missing
+    parent tasks (orphans), duplicated ids and cycles are rejected.
+
+    Parameters
+    ---------
+    tasks: list[dict]
+    Each task includes title (required), id, parent_id, status,
+    created and completed_date (optional)
+
+    parent_id: int
+    existing task the top level tasks are added under.
+    Default None (the tasks become projects)
+
+    Returns
+    --------
+    result: dict
+    status_code: int
+    Dictionary with key imported and value being the number of
+    inserted tasks.
+    '''
+    rows = []
+    for task in tasks:
+        if not isinstance(task, dict):
+            return {'error': 'Bad task data.'}, 400
+        ref, parent_ref = task.get('id'), task.get('parent_id')
+        if not is_ref(ref):
+            return {'error': 'Bad task id.'}, 400
+        if not is_ref(parent_ref):
+            return {'error': 'Bad parent id.'}, 400
+        rows.append({
+            'ref': object() if ref is None else str(ref),
+            'parent_ref': None if parent_ref is None else str(parent_ref),
+            'parent_id': parent_id,
+            'title': task.get('title'),
+            'status': task.get('status'),
+            'created': task.get('created'),
+            'completed_date': task.get('completed_date')})
+    try:
+        ids = insert_task_rows(get_db(), rows)
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    return {'imported': len(ids)}, 200
+
+
+@db_cli.command('import')
+@click.argument('file', type=click.Path(exists=True, dir_okay=False,
+                                        path_type=Path))
+@click.option('--format', 'format', type=click.Choice(['csv', 'json']),
+              help='File format. Default from the file extension.')
+@click.option('--parent', type=int,
+              help='Add the imported projects under this task.')
+def import_command(file: Path, format: str | None, parent: int | None):
+    '''
+    Import tasks from a csv or json export.
+    '''
+    format = format or ('csv' if file.suffix.lower() == '.csv' else 'json')
+    try:
+        with open(file, encoding='utf-8-sig', newline='') as f:
+            tasks = read_tasks(f, format)
+    except ValueError as e:
+        raise click.ClickException(f'Bad {format} file: {e}')
+    result, status_code = import_tasks(tasks, parent)
+    if status_code != 200:
+        raise click.ClickException(result['error'])
+    click.echo(f"Imported {result['imported']} tasks.")
+
+
+def insert_task_rows(db: Connection, rows: list[dict]) -> dict:
+    '''
+    Description
+    -----------
+    Insert tasks with executemany inside a single transaction.
+    New ids are assigned up front and parents are always inserted
+    before their children, so the whole batch is one statement.
+
+    With STATUS_ROLLUP, the status of new tasks with new sub tasks is
+    derived from them (the status sent for these tasks is ignored) and
+    the existing parents are rolled up afterwards (see rollup_status).
+
+    Batches of at least BULK_INSERT_MIN_ROWS rows are inserted without
+    the insert triggers (they are recreated in the same transaction),
+    see index_new_tasks.
+
+    Parameters
+    ---------
+    db: sqlite3.Connection
+
+    rows: list[dict]
+    Each row includes
+    ref: temporary id, unique inside rows (required)
+    title: str (required)
+    parent_ref: ref of the parent task inside rows
+    parent_id: id of an existing parent task (used without parent_ref)
+    status, created, completed_date: optional task columns
+
+    Returns
+    --------
+    ids: dict
+    map each ref to the id of the inserted task.
+    Raise ValueError if the rows are invalid (nothing is inserted).
+    '''
+    children = {}
+    roots = []
+    refs = set()
+    for row in rows:
+        if not row.get('title'):
+            raise ValueError('Missing title.')
+        if not isinstance(row['title'], str):
+            raise ValueError('Title has to be a string.')
+        if not isinstance(row.get('status'), (str, type(None))):
+            raise ValueError('Status has to be a string.')
+        for column in ('created', 'completed_date'):
+            if not isinstance(row.get(column), (str, type(None))):
+                raise ValueError(f'{column.capitalize()} has to be a string.')
+        if row['ref'] in refs:
+            raise ValueError(f"Duplicate id {row['ref']}.")
+        refs.add(row['ref'])
+        if row.get('parent_ref') is None:
+            roots.append(row)
+        else:
+            children.setdefault(row['parent_ref'], []).append(row)
+    for parent_ref in children:
+        if parent_ref not in refs:
+            raise ValueError(f'Unknown parent id {parent_ref}.')
+
+    # order parents before children, rows left out are in a cycle
+    ordered = []
+    stack = list(reversed(roots))
+    while stack:
+        row = stack.pop()
+        ordered.append(row)
+        stack.extend(reversed(children.get(row['ref'], [])))
+    if len(ordered) != len(rows):
+        raise ValueError('Tasks cannot be their own parent '
+                         'or form a cycle.')
+
+    statuses = {row['ref']: row.get('status') for row in ordered}
+    if current_app.config.get('STATUS_ROLLUP', True):
+        # new parents get the status of their new children, bottom-up
+        counts = {}
+        for row in reversed(ordered):
+            if row['ref'] in counts:
+                statuses[row['ref']] = derive_status(
+                    *(counts[row['ref']].get(status, 0)
+                      for status in ('EMPTY', 'HALF', 'FULL')))
+            if row.get('parent_ref') is not None:
+                count = counts.setdefault(row['parent_ref'], {})
+                status = statuses[row['ref']] or 'EMPTY'
+                count[status] = count.get(status, 0) + 1
+
+    try:
+        if not db.in_transaction:
+            db.execute('BEGIN IMMEDIATE')
+        start = db.execute(
+            '''SELECT MAX(
+            COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'task'), 0),
+            COALESCE((SELECT MAX(id) FROM task), 0))''').fetchone()[0]
+        ids = {row['ref']: start + i
+               for i, row in enumerate(ordered, start=1)}
+        # large batches skip the per row insert triggers and
+        # fill task_closure, the counters and task_fts afterwards
+        bulk = len(ordered) >= BULK_INSERT_MIN_ROWS
+        if bulk:
+            triggers = db.execute(
+                '''SELECT name, sql FROM sqlite_master
+                WHERE type = 'trigger' AND name IN
+                (SELECT value FROM json_each(?))''',
+                (json.dumps(INSERT_TRIGGERS),)).fetchall()
+            for trigger in triggers:
+                db.execute(f"DROP TRIGGER {trigger['name']}")
+        db.executemany(
+            '''INSERT INTO task
+            (id, parent_id, title, status, created, completed_date)
+            VALUES (?, ?, ?, COALESCE(?, 'EMPTY'),
+            COALESCE(?, CURRENT_TIMESTAMP), ?)''',
+            [(ids[row['ref']],
+              ids[row['parent_ref']] if row.get('parent_ref') is not None
+              else row.get('parent_id'),
+              row['title'], statuses[row['ref']], row.get('created'),
+              row.get('completed_date'))
+             for row in ordered])
+        if bulk:
+            index_new_tasks(db, start)
+            for trigger in triggers:
+                db.execute(trigger['sql'])
+        rollup_status(db, [row.get('parent_id') for row in roots])
+        db.commit()
+    except db.IntegrityError:
+        db.rollback()
+        raise ValueError('Bad parent id or status.')
+    except db.Error:
+        # i.e. database is locked, also restores dropped triggers
+        db.rollback()
+        raise
+    invalidate()
+    return ids
+
+
+def is_ref(value) -> bool:
+    '''
+    Description
+    -----------
+    Check that a task id of a request or a file is a single value
+    (None, an int or a str).
+
+    Parameters
+    ---------
+    value: Any
+
+    Returns
+    --------
+    result: bool
+    '''
+    return value is None or (isinstance(value, (int, str)) and
+                             not isinstance(value, bool))
+
+
+def index_new_tasks(db: Connection, after_id: int):
+    '''
+    Description
+    -----------
+    Do the work of the insert triggers (INSERT_TRIGGERS) for all tasks
+    with an id larger than after_id, with one statement per table
+    instead of one per task: add their task_closure rows, recount the
+    child counters of their parents, add their titles to task_fts and
+    bump the data version once.
+
+    Runs inside the caller's transaction, the caller commits.
+
+    Parameters
+    ---------
+    db: sqlite3.Connection
+
+    after_id: int
+    largest task id before the new tasks were inserted.
+
+    Returns
+    --------
+    None
+    '''
+    # pairs inside the new tasks (a new task only has new sub tasks)
+    db.execute(
+        '''
+        INSERT INTO task_closure (ancestor, descendant, depth)
+        WITH RECURSIVE closure(ancestor, descendant, depth) AS (
+            SELECT id, id, 0 FROM task WHERE id > ?
+            UNION ALL
+            SELECT c.ancestor, t.id, c.depth + 1
+            FROM closure c
+            INNER JOIN task t ON t.parent_id = c.descendant
+        )
+        SELECT ancestor, descendant, depth FROM closure;
+        ''', (after_id,))
+    # link the new trees added under existing tasks
+    db.execute(
+        '''
+        INSERT INTO task_closure (ancestor, descendant, depth)
+        SELECT p.ancestor, c.descendant, p.depth + c.depth + 1
+        FROM task r
+        INNER JOIN task_closure p ON p.descendant = r.parent_id
+        INNER JOIN task_closure c ON c.ancestor = r.id
+        WHERE r.id > ? AND r.parent_id <= ?;
+        ''', (after_id, after_id))
+    db.execute(
+        '''
+        UPDATE task SET
+        empty_children = (SELECT COUNT(*) FROM task c
+                          WHERE c.parent_id = task.id AND c.status = 'EMPTY'),
+        half_children = (SELECT COUNT(*) FROM task c
+                         WHERE c.parent_id = task.id AND c.status = 'HALF'),
+        full_children = (SELECT COUNT(*) FROM task c
+                         WHERE c.parent_id = task.id AND c.status = 'FULL')
+        WHERE id IN (SELECT parent_id FROM task WHERE id > ?);
+        ''', (after_id,))
+    db.execute(
+        '''
+        INSERT INTO task_fts (rowid, title)
+        SELECT id, title FROM task WHERE id > ?;
+        ''', (after_id,))
+    db.execute('UPDATE data_version SET version = version + 1 WHERE id = 1')
+
+
 def patch_task(id: int, data: dict[str, str | int]) -> tuple[dict, int]:
     '''
     Description
     -----------
     Update task information in the database.
     Only changes on ['parent_id', 'status', 'title'] are allowed.
-
+    A task can't become its own parent or the child of one of
+    its sub tasks (checked with one task_closure lookup, and again by
+    the task_no_cycle trigger inside the write transaction).
 
     Parameters
     ---------
@@ -254,17 +1340,32 @@ def patch_task(id: int, data: dict[str, str | int]) -> tuple[dict, int]:
     safe_updates = {k: v for k, v in data.items() if k in allowed_columns}
     if not safe_updates:
         return {'error': 'All bad fields.'}, 400
+    cycle_error = {'error': 'Parent task cannot be the task itself '
+                   'or one of its sub tasks.'}
+    if is_descendant(db, safe_updates.get('parent_id'), id):
+        return cycle_error, 400
     sql_set_parts = [f"{k} = ?" for k in safe_updates]
     sql_set_clause = ", ".join(sql_set_parts)
     params = tuple(safe_updates.values()) + (id,)
     try:
+        old = db.execute('SELECT parent_id FROM task WHERE id = ?',
+                         (id,)).fetchone()
         cur = db.execute(
             f"UPDATE task SET {sql_set_clause} WHERE id = ?",
             params)
         if cur.rowcount == 0:
             return {'error': 'Id does not exist.'}, 400
+        if 'status' in safe_updates or 'parent_id' in safe_updates:
+            new = db.execute('SELECT parent_id FROM task WHERE id = ?',
+                             (id,)).fetchone()
+            rollup_status(db, [old['parent_id'], new['parent_id']])
         db.commit()
-    except db.IntegrityError:
+        invalidate()
+    except db.IntegrityError as e:
+        db.rollback()
+        # moved concurrently (see the task_no_cycle trigger)
+        if 'task cycle' in str(e):
+            return cycle_error, 400
         return {'error': 'Bad data.'}, 400
 
     updated = db.execute(
@@ -273,31 +1374,166 @@ def patch_task(id: int, data: dict[str, str | int]) -> tuple[dict, int]:
     return {'tasks': RowsToList(updated)}, 200
 
 
-def delete_task(id: int) -> tuple[dict, int]:
+def patch_status(status: str, ids: list[int] | None = None,
+                 root: int | None = None) -> tuple[dict, int]:
+    '''
+    Description
+    -----------
+    Update the status of a list of tasks, or of a whole subtree,
+    with a single UPDATE statement in one transaction.
+
+    Parameters
+    ---------
+    status: str
+    ['EMPTY','HALF','FULL'] (case insensitive)
+
+    ids: list[int]
+    ids of the tasks to update. (used if root is None)
+
+    root: int
+    id of the subtree root, the root and all its sub tasks are updated.
+
+    Returns
+    --------
+    result: dict
+    status_code: int
+    Dictionary with key updated and value being the number of tasks
+    updated.
+    '''
+    if not isinstance(status, str) or \
+            status.upper() not in ('EMPTY', 'HALF', 'FULL'):
+        return {'error': 'Bad status.'}, 400
+    db = get_db()
+    try:
+        if root is not None:
+            ids = [to_id(root)]
+            cur = db.execute(
+                '''UPDATE task SET status = ?
+                WHERE id IN (SELECT descendant FROM task_closure
+                             WHERE ancestor = ?)''',
+                (status.upper(), ids[0]))
+        elif isinstance(ids, list) and ids:
+            ids = [to_id(id) for id in ids]
+            cur = db.execute(
+                '''UPDATE task SET status = ?
+                WHERE id IN (SELECT value FROM json_each(?))''',
+                (status.upper(), json.dumps(ids)))
+        else:
+            return {'error': 'Missing ids or root.'}, 400
+    except ValueError:
+        return {'error': 'Ids have to be integers.'}, 400
+    parents = db.execute(
+        '''SELECT DISTINCT parent_id FROM task
+        WHERE id IN (SELECT value FROM json_each(?))''',
+        (json.dumps(ids),)).fetchall()
+    rollup_status(db, [row['parent_id'] for row in parents])
+    db.commit()
+    invalidate()
+    return {'updated': cur.rowcount}, 200
+
+
+def to_id(value: int | str) -> int:
+    '''
+    Description
+    -----------
+    Convert a task id of request data to int without truncating:
+    only ints (not bools) and strings of digits are accepted.
+
+    Parameters
+    ---------
+    value: int | str
+
+    Returns
+    --------
+    id: int
+    Raise ValueError for any other value, i.e. 1.9, True or [1].
+    '''
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        return int(value)
+    raise ValueError(f'Bad task id {value!r}.')
+
+
+def is_descendant(db: Connection, id: int | str | None,
+                  ancestor: int | str) -> bool:
+    '''
+    Description
+    -----------
+    Check if a task is the ancestor task itself or one of its sub tasks.
+    This is a single primary key lookup in task_closure,
+    the cost doesn't depend on the size of the subtree.
+
+    Parameters
+    ---------
+    db: sqlite3.Connection
+
+    id: int | str | None
+    id of the task to check. None (no task) is never a descendant.
+
+    ancestor: int | str
+    id of the ancestor task.
+
+    Returns
+    --------
+    result: bool
+    '''
+    try:
+        id, ancestor = int(id), int(ancestor)
+    except (TypeError, ValueError):
+        return False
+    row = db.execute(
+        'SELECT 1 FROM task_closure WHERE ancestor = ? AND descendant = ?',
+        (ancestor, id)).fetchone()
+    return row is not None
+
+
+def delete_task(id: int, cascade: bool = False) -> tuple[dict, int]:
     '''
     Description
     -----------
     Delete a specific task.
     Deletion will failed if child tasks exist (IntegrationError)
+    unless cascade is True, then the task and all its sub tasks are
+    deleted with one statement in a single transaction.
 
     Parameters
     ---------
     id: int
     id for the target task.
 
+    cascade: bool. Default False
+    whether or not to delete the sub tasks as well.
+
     Returns
     --------
     result: dict
     status_code: int
     If successful, return a dictionary with
     tasks as key and empty string as value. Along with status code 204.
+    With cascade, return a dictionary with key deleted and value being
+    the number of tasks deleted. Along with status code 200.
     Error information and 400 is returned if deletion failed.
     '''
     db = get_db()
+    parent = db.execute('SELECT parent_id FROM task WHERE id = ?',
+                        (id,)).fetchone()
+    parent_ids = [parent['parent_id']] if parent else []
+    if cascade:
+        cur = db.execute(
+            '''DELETE FROM task
+            WHERE id IN (SELECT descendant FROM task_closure
+                         WHERE ancestor = ?)''', (id,))
+        rollup_status(db, parent_ids)
+        db.commit()
+        invalidate()
+        return {'deleted': cur.rowcount}, 200
     try:
         db.execute("DELETE FROM task where id=(?)",
                    (id,))
+        rollup_status(db, parent_ids)
         db.commit()
+        invalidate()
         return {'tasks': ''}, 204
     except db.IntegrityError:
         return {'error':
@@ -305,12 +1541,87 @@ def delete_task(id: int) -> tuple[dict, int]:
                 }, 400
 
 
+def rollup_status(db: Connection, parent_ids: list[int | None]):
+    '''
+    Description
+    -----------
+    Derive the status of the given parent tasks from the stored
+    child counters and propagate changes up the ancestor chain.
+    A parent becomes FULL if all children are FULL, EMPTY if all
+    children are EMPTY and HALF otherwise. The walk stops as soon
+    as a status doesn't change, so it costs at most O(depth) updates.
+
+    Does nothing if the STATUS_ROLLUP config is False.
+    Runs inside the caller's transaction, the caller commits.
+
+    Parameters
+    ---------
+    db: sqlite3.Connection
+
+    parent_ids: list[int | None]
+    parents of the tasks that changed. None values are ignored.
+
+    Returns
+    --------
+    None
+    '''
+    if not current_app.config.get('STATUS_ROLLUP', True):
+        return
+    pending = [id for id in parent_ids if id is not None]
+    while pending:
+        task = db.execute(
+            '''SELECT id, parent_id, status,
+            empty_children, half_children, full_children
+            FROM task WHERE id = ?''', (pending.pop(),)).fetchone()
+        if task is None:
+            continue
+        status = derive_status(task['empty_children'], task['half_children'],
+                               task['full_children'])
+        if status is None or status == task['status']:
+            continue
+        # the counters of the grandparent are updated by trigger
+        db.execute('UPDATE task SET status = ? WHERE id = ?',
+                   (status, task['id']))
+        if task['parent_id'] is not None:
+            pending.append(task['parent_id'])
+
+
+def derive_status(empty: int, half: int, full: int) -> str | None:
+    '''
+    Description
+    -----------
+    Status of a parent task from the number of children in each status:
+    FULL if all children are FULL, EMPTY if all children are EMPTY
+    and HALF otherwise.
+
+    Parameters
+    ---------
+    empty: int
+    half: int
+    full: int
+
+    Returns
+    --------
+    status: str | None
+    None if there are no children.
+    '''
+    total = empty + half + full
+    if total == 0:
+        return None
+    if full == total:
+        return 'FULL'
+    if empty == total:
+        return 'EMPTY'
+    return 'HALF'
+
+
 def show_lineage(id: int) -> tuple[dict, int]:
     '''
     Description
     -----------
     Show the lineage of the parent tasks all the way
     up to the root task. (a task with no parent id)
+    Ancestors are read from the task_closure table.
 
     The parent tasks are concat into a string with >> in between.
 
@@ -328,22 +1639,78 @@ def show_lineage(id: int) -> tuple[dict, int]:
     db = get_db()
     data = db.execute(
         '''
-        WITH RECURSIVE Lineage AS (
-        SELECT id, title, parent_id, 1 AS Level
-        FROM task
-        WHERE id = ?
-        UNION ALL
-        SELECT t.id, t.title, t.parent_id, l.Level + 1
-        FROM task t
-        INNER JOIN Lineage l ON t.id = l.parent_id
-        )
-        SELECT title FROM Lineage
-        ORDER BY Level;
+        SELECT t.title
+        FROM task_closure c
+        INNER JOIN task t ON t.id = c.ancestor
+        WHERE c.descendant = ? AND c.depth > 0
+        ORDER BY c.depth;
         ''', (id,)).fetchall()
-    result = ' >> '.join([task['title'] for task in data[1:]])
+    result = ' >> '.join([task['title'] for task in data])
     return {'lineage': result}, 200
 
 
+def show_lineages(ids: list[int]) -> tuple[dict, int]:
+    '''
+    Description
+    -----------
+    Batch version of show_lineage.
+    Resolve the lineage of every given task with a single query
+    instead of one query per task.
+
+    Parameters
+    ---------
+    ids: list[int]
+    Target task ids (the lowest level to query.)
+
+    Returns
+    --------
+    result: dict
+    status_code: int
+    Dictionary with key lineages and value being a dictionary
+    that maps each task id to its concatenated lineage string.
+    Ids that don't exist are left out.
+    '''
+    db = get_db()
+    data = db.execute(
+        '''
+        SELECT c.descendant AS origin, t.title, c.depth
+        FROM task_closure c
+        INNER JOIN task t ON t.id = c.ancestor
+        WHERE c.descendant IN (SELECT value FROM json_each(?))
+        ORDER BY c.descendant, c.depth;
+        ''', (json.dumps([int(id) for id in ids]),)).fetchall()
+    titles = {}
+    for row in data:
+        parents = titles.setdefault(row['origin'], [])
+        if row['depth'] > 0:
+            parents.append(row['title'])
+    result = {id: ' >> '.join(parents) for id, parents in titles.items()}
+    return {'lineages': result}, 200
+
+
+def add_lineage(tasks: list[dict]) -> list[dict]:
+    '''
+    Description
+    -----------
+    Add the lineage string to each task under the key lineage.
+    All lineages are resolved in one query with show_lineages.
+
+    Parameters
+    ---------
+    tasks: list[dict]
+    The queried tasks from database. Each task requires an id.
+
+    Returns
+    --------
+    tasks: list[dict]
+    The same list, with lineage added to every task.
+    '''
+    data, _ = show_lineages([task['id'] for task in tasks])
+    for task in tasks:
+        task['lineage'] = data['lineages'].get(task['id'], '')
+    return tasks
+
+
 def get_available_parent(id: int) -> tuple[dict, int]:
     '''
     Description
@@ -368,23 +1735,62 @@ def get_available_parent(id: int) -> tuple[dict, int]:
     db = get_db()
     data = db.execute(
         '''
-            WITH RECURSIVE TaskTree AS (
-            SELECT id, title, parent_id, status, 1 AS Level
-            FROM task
-            WHERE id = ?
-            UNION ALL
-            SELECT t.id, t.title, t.parent_id, t.status, tt.Level + 1
-            FROM task t
-            INNER JOIN TaskTree tt ON t.parent_id = tt.id
-            )
             SELECT id,title FROM task
-            where id not in (SELECT id FROM TaskTree)
+            where id not in (SELECT descendant FROM task_closure
+                             WHERE ancestor = ?)
         ''', (id,)).fetchall()
     options = [{'id': '', 'title': '-'}]
     options.extend(RowsToList(data))
     return {'options': options}, 200
 
 
+def search_parents(q: str, id: int | None = None, limit: int = 10
+                   ) -> tuple[dict, int]:
+    '''
+    Description
+    -----------
+    Return the tasks whose title starts with q (case insensitive)
+    that can be assigned as the parent task of the task id.
+    The title prefix is searched with the idx_task_title index in
+    title order and each candidate is checked with one task_closure
+    primary key lookup (the task and its sub tasks are excluded), so
+    the search stops after limit rows and the excluded subtree is
+    never read as a whole.
+
+    Parameters
+    ---------
+    q: str
+    start of the title. An empty string matches every task.
+
+    id: int
+    Target task id. Default None (a new task, nothing is excluded)
+
+    limit: int. Default 10
+    maximum number of tasks to return.
+
+    Returns
+    --------
+    result: dict
+    status_code: int
+    Dictionary with key options and value being a list of
+    {'id', 'title'} ordered by title.
+    '''
+    if limit <= 0:
+        return {'error': 'Limit has to be a positive integer.'}, 400
+    pattern = re.sub(r'([\\%_])', r'\\\1', q) + '%'
+    db = get_db()
+    data = db.execute(
+        '''
+        SELECT id, title FROM task
+        WHERE title LIKE ? ESCAPE '\\'
+        AND NOT EXISTS (SELECT 1 FROM task_closure
+                        WHERE ancestor = ? AND descendant = task.id)
+        ORDER BY title COLLATE NOCASE
+        LIMIT ?;
+        ''', (pattern, id, limit)).fetchall()
+    return {'options': RowsToList(data)}, 200
+
+
 def RowsToList(data: Row) -> list[dict | None]:
     '''
     Description
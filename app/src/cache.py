@@ -0,0 +1,209 @@
+from flask import Flask, current_app, g
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+from .db import get_data_version
+import sys
+import threading
+
+
+class TaskCache:
+    '''
+    Description
+    -----------
+    In-process cache for assembled task views (trees, forests and
+    API results). Entries are only valid for the data version they were
+    built from (see db.get_data_version). Every write to task bumps the
+    version, also writes of other processes, and all entries are dropped
+    when a new version is seen.
+
+    Parameters
+    ---------
+    max_entries: int. Default 128
+    maximum number of cached views. The least recently used entry is
+    evicted when the cache is full. 0 disables caching.
+
+    max_bytes: int. Default 64 MiB
+    maximum approximate size of all cached views (see approximate_size).
+    Views larger than max_bytes are not cached.
+    '''
+
+    def __init__(self, max_entries: int = 128,
+                 max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version = None
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        # key -> (value, approximate size)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Any],
+                     version: Hashable) -> Any:
+        '''
+        Return the value of key cached for version
+        or build, store and return it.
+        '''
+        with self._lock:
+            if version != self.version:
+                self._clear()
+                self.version = version
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+        value = build()
+        if self.max_entries <= 0:
+            return value
+        size = approximate_size(value)
+        with self._lock:
+            # don't store values built while a write happened
+            if version == self.version and size <= self.max_bytes:
+                if key in self._entries:
+                    self.size -= self._entries[key][1]
+                self._entries[key] = (value, size)
+                self._entries.move_to_end(key)
+                self.size += size
+                while len(self._entries) > self.max_entries or \
+                        self.size > self.max_bytes:
+                    self.size -= self._entries.popitem(last=False)[1][1]
+        return value
+
+    def invalidate(self):
+        '''
+        Drop all cached values, the next lookup reads a new data version.
+        '''
+        with self._lock:
+            self.version = None
+            self._clear()
+
+    def _clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self) -> dict:
+        '''
+        Return the current version, size and hit/miss counters.
+        '''
+        with self._lock:
+            return {'version': self.version,
+                    'entries': len(self._entries),
+                    'max_entries': self.max_entries,
+                    'bytes': self.size,
+                    'max_bytes': self.max_bytes,
+                    'hits': self.hits,
+                    'misses': self.misses}
+
+
+def approximate_size(value: Any) -> int:
+    '''
+    Description
+    -----------
+    Approximate memory size of a view: the sum of sys.getsizeof of all
+    dicts, lists, tuples and values it contains. Shared objects are
+    counted every time they are referenced.
+
+    Parameters
+    ---------
+    value: Any
+
+    Returns
+    --------
+    size: int
+    bytes.
+    '''
+    size = 0
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return size
+
+
+def init_app(app: Flask):
+    '''
+    Description
+    -----------
+    Attach a TaskCache sized by TASK_CACHE_SIZE (entries)
+    and TASK_CACHE_BYTES to the app.
+
+    Parameters
+    ---------
+    app: Flask
+
+    Returns
+    --------
+    None
+    '''
+    app.extensions['task_cache'] = TaskCache(
+        app.config.get('TASK_CACHE_SIZE', 128),
+        app.config.get('TASK_CACHE_BYTES', 64 * 1024 * 1024))
+
+
+def get_cache() -> TaskCache:
+    '''
+    Description
+    -----------
+    Return the TaskCache of the current app.
+
+    Parameters
+    ---------
+    None
+
+    Returns
+    --------
+    cache: TaskCache
+    '''
+    return current_app.extensions['task_cache']
+
+
+def cached(key: Hashable, build: Callable[[], Any]) -> Any:
+    '''
+    Description
+    -----------
+    Return the view of key cached for the current data version,
+    or build, store and return it.
+
+    Parameters
+    ---------
+    key: Hashable
+    identify the cached view, i.e. ('get_task', 1, 'tree')
+
+    build: Callable
+    function without arguments that builds the value on a miss.
+
+    Returns
+    --------
+    value: Any
+    The cached or newly built value. Callers must not mutate it.
+    '''
+    task_cache = get_cache()
+    if task_cache.max_entries <= 0:
+        return build()
+    return task_cache.get_or_build(key, build, get_data_version())
+
+
+def invalidate():
+    '''
+    Description
+    -----------
+    Drop the cached views of the current app right away.
+    Call after every committed write to the task table (writes of other
+    processes are noticed from the data version).
+
+    Parameters
+    ---------
+    None
+
+    Returns
+    --------
+    None
+    '''
+    g.pop('data_version', None)
+    get_cache().invalidate()
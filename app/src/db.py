@@ -1,14 +1,200 @@
 from flask import g, current_app
+from flask.cli import AppGroup
+import click
 import sqlite3
 import os
+import queue
+import threading
 from pathlib import Path
+from .metrics import InstrumentedConnection, prepare_connection
+
+MIGRATIONS_PATH = Path(__file__).resolve().parent.parent / 'migrations'
+SAMPLE_DATA_PATH = Path(__file__).resolve().parent.parent / 'sample_data.sql'
+
+
+class ConnectionPool:
+    '''
+    Description
+    -----------
+    Keep a number of configured sqlite connections to a single database
+    file so they can be reused across requests.
+
+    Each connection is configured once when it is opened
+    (WAL journaling, synchronous=NORMAL, busy timeout, cache size,
+    mmap size and foreign keys). A checked out connection is used by
+    a single thread (the request holding it) until it is checked back in.
+
+    Parameters
+    ---------
+    database: str | Path
+    path to the sqlite file.
+
+    size: int. Default 5
+    maximum number of idle connections kept in the pool.
+    Extra connections are closed when checked back in.
+
+    busy_timeout: int. Default 5000
+    milliseconds to wait for a lock before raising "database is locked".
+
+    cache_size: int. Default -8000
+    sqlite page cache size (negative values are in KiB).
+
+    mmap_size: int. Default 67108864
+    bytes of the database file to memory map.
+
+    factory: type. Default sqlite3.Connection
+    connection class, i.e. metrics.InstrumentedConnection.
+    '''
+
+    def __init__(self, database: str | Path, size: int = 5,
+                 busy_timeout: int = 5000, cache_size: int = -8000,
+                 mmap_size: int = 64 * 1024 * 1024,
+                 factory: type = sqlite3.Connection):
+        self.database = str(database)
+        self.size = size
+        self.busy_timeout = busy_timeout
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.factory = factory
+        self.closed = False
+        self._idle = queue.LifoQueue(maxsize=max(size, 1))
+
+    def connect(self) -> sqlite3.Connection:
+        '''
+        Open and configure a new connection.
+        '''
+        conn = sqlite3.connect(self.database, check_same_thread=False,
+                               factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    @staticmethod
+    def is_healthy(conn: sqlite3.Connection) -> bool:
+        '''
+        Check that an idle connection can still run a query.
+        '''
+        try:
+            conn.execute("SELECT 1").fetchone()
+        except sqlite3.Error:
+            return False
+        return True
+
+    def checkout(self) -> sqlite3.Connection:
+        '''
+        Hand out an idle connection (or a new one if none is idle).
+        Connections failing the health check are replaced.
+        '''
+        if self.closed:
+            raise sqlite3.ProgrammingError('Connection pool is closed.')
+        conn = None
+        while conn is None:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self.connect()
+                break
+            if not self.is_healthy(conn):
+                conn.close()
+                conn = None
+        return conn
+
+    def checkin(self, conn: sqlite3.Connection):
+        '''
+        Return a connection to the pool.
+        Uncommitted changes are rolled back.
+        '''
+        if conn.in_transaction:
+            conn.rollback()
+        if self.closed or self.size <= 0:
+            conn.close()
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        '''
+        Close all idle connections. Connections still checked out
+        are closed when they are checked back in.
+        '''
+        self.closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(database: str | Path) -> ConnectionPool:
+    '''
+    Description
+    -----------
+    Return the connection pool of the database,
+    create it from the current app config if it doesn't exist yet.
+
+    Parameters
+    ---------
+    database: str | Path
+    path to the sqlite file.
+
+    Returns
+    --------
+    pool: ConnectionPool
+    '''
+    key = str(database)
+    with _pools_lock:
+        if key not in _pools:
+            config = current_app.config
+            _pools[key] = ConnectionPool(
+                key,
+                size=config.get('DB_POOL_SIZE', 5),
+                busy_timeout=config.get('DB_BUSY_TIMEOUT', 5000),
+                cache_size=config.get('DB_CACHE_SIZE', -8000),
+                mmap_size=config.get('DB_MMAP_SIZE', 64 * 1024 * 1024),
+                factory=InstrumentedConnection
+                if config.get('SQL_METRICS', True) or
+                config.get('SLOW_QUERY_MS') else sqlite3.Connection)
+        return _pools[key]
+
+
+def close_pool(database: str | Path):
+    '''
+    Description
+    -----------
+    Close and forget the connection pool of the database (if any).
+
+    Parameters
+    ---------
+    database: str | Path
+    path to the sqlite file.
+
+    Returns
+    --------
+    None
+    '''
+    with _pools_lock:
+        pool = _pools.pop(str(database), None)
+    if pool is not None:
+        pool.close()
 
 
 def get_db() -> sqlite3.Connection:
     '''
     Description
     -----------
-    add db object to flask.g and also return it.
+    Check out a connection from the pool,
+    add it to flask.g and also return it.
 
     Parameters
     ---------
@@ -19,20 +205,52 @@ def get_db() -> sqlite3.Connection:
     db: sqlite3.Connection
     '''
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE']
-        )
-        g.db.row_factory = sqlite3.Row
-        g.db.execute("PRAGMA foreign_keys = ON")
+        pool = get_pool(current_app.config['DATABASE'])
+        g.db = pool.checkout()
+        g.db_pool = pool
+        # query counters and slow query log of this request only
+        if isinstance(g.db, InstrumentedConnection):
+            prepare_connection(g.db)
 
     return g.db
 
 
+def get_data_version() -> str:
+    '''
+    Description
+    -----------
+    Return the version of the task data with one primary key lookup.
+    The data_version table is bumped by triggers on every write to task,
+    so the version also changes on writes of other processes, other
+    connections and the flask db commands.
+
+    The version is read once per request (kept in flask.g), so the ETag
+    and the cached views of a request use the same version.
+    cache.invalidate forgets it after a write.
+
+    Parameters
+    ---------
+    None
+
+    Returns
+    --------
+    version: str
+    <epoch>-<number of writes>, i.e. '3fa2c1d0-42'
+    '''
+    if 'data_version' not in g:
+        row = get_db().execute(
+            'SELECT epoch, version FROM data_version WHERE id = 1'
+        ).fetchone()
+        g.data_version = f"{row['epoch']}-{row['version']}"
+    return g.data_version
+
+
 def close_db(e=None):
     '''
     Description
     -----------
-    Remove database connection from flask.g and close connection.
+    Remove database connection from flask.g and
+    return it to the connection pool.
 
     Parameters
     ---------
@@ -44,15 +262,41 @@ def close_db(e=None):
     None
     '''
     db = g.pop('db', None)
+    pool = g.pop('db_pool', None)
     if db is not None:
-        db.close()
+        if pool is not None:
+            pool.checkin(db)
+        else:
+            db.close()
+
+
+def handle_locked(e: sqlite3.OperationalError):
+    '''
+    Description
+    -----------
+    Error handler for sqlite3.OperationalError. A write that waited
+    longer than DB_BUSY_TIMEOUT for the write lock ("database is locked")
+    gets a 503 json response with Retry-After, other errors are raised.
+
+    Parameters
+    ---------
+    e: sqlite3.OperationalError
+
+    Returns
+    --------
+    response: tuple
+    '''
+    if 'database is locked' not in str(e):
+        raise e
+    return {'error': 'Database is locked.'}, 503, {'Retry-After': '1'}
 
 
 def init_db(folder_path: str | Path, load_sample: bool = True):
     '''
     Description
     -----------
-    Create sqlite file, create schema and load sample data (option)
+    Recreate sqlite file from scratch, apply all migrations
+    and load sample data (option). Existing data is removed.
 
     Parameters
     ---------
@@ -69,11 +313,119 @@ def init_db(folder_path: str | Path, load_sample: bool = True):
     if not os.path.exists(folder_path):
         raise FileExistsError("Path doesn't exist.")
     DB_PATH = Path(folder_path) / 'app.sqlite'
-    if os.path.exists(DB_PATH):
-        os.unlink(DB_PATH)
-    db = sqlite3.connect(DB_PATH)
-    with open('app/schema.sql', encoding='utf-8') as f:
-        db.executescript(f.read())
-    if load_sample:
-        with open('app/sample_data.sql', encoding='utf-8') as f:
-            db.executescript(f.read())
+    # pooled connections would keep pointing at the removed file
+    close_pool(DB_PATH)
+    for path in (DB_PATH, Path(f'{DB_PATH}-wal'), Path(f'{DB_PATH}-shm')):
+        if os.path.exists(path):
+            os.unlink(path)
+    upgrade_db(DB_PATH, load_sample=load_sample)
+
+
+def list_migrations() -> list[tuple[int, str, Path]]:
+    '''
+    Description
+    -----------
+    List the migration scripts in app/migrations.
+    Scripts are named <version>_<name>.sql and sorted by version.
+
+    Parameters
+    ---------
+    None
+
+    Returns
+    --------
+    migrations: list[tuple[int, str, Path]]
+    version, name and path of each migration script.
+    '''
+    migrations = []
+    for path in MIGRATIONS_PATH.glob('*.sql'):
+        version, _, name = path.stem.partition('_')
+        migrations.append((int(version), name, path))
+    return sorted(migrations)
+
+
+def upgrade_db(database: str | Path, load_sample: bool = False
+               ) -> list[str]:
+    '''
+    Description
+    -----------
+    Apply the migrations that are missing from the schema_version table.
+    Each migration runs in its own transaction, existing data is kept.
+    A newly created database is filled with sample data (option).
+
+    Parameters
+    ---------
+    database: str | Path
+    path to the sqlite file. The file is created if it doesn't exist.
+
+    load_sample: bool. Default False
+    whether or not to load sample data if the database is new.
+
+    Returns
+    --------
+    applied: list[str]
+    file names of the migrations applied.
+    '''
+    db = sqlite3.connect(database)
+    try:
+        is_new = db.execute(
+            "SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0
+        db.execute('''CREATE TABLE IF NOT EXISTS schema_version(
+                      version INTEGER PRIMARY KEY,
+                      name TEXT NOT NULL,
+                      applied TIMESTAMP NOT NULL
+                      DEFAULT CURRENT_TIMESTAMP)''')
+        db.commit()
+        current = db.execute(
+            "SELECT COALESCE(MAX(version), 0) FROM schema_version"
+        ).fetchone()[0]
+        applied = []
+        for version, name, path in list_migrations():
+            if version <= current:
+                continue
+            with open(path, encoding='utf-8') as f:
+                script = f.read()
+            try:
+                db.executescript(
+                    f'''BEGIN;
+                    {script}
+                    ;
+                    INSERT INTO schema_version (version, name)
+                    VALUES ({version}, '{name}');
+                    COMMIT;''')
+            except sqlite3.Error:
+                if db.in_transaction:
+                    db.rollback()
+                raise
+            applied.append(path.name)
+        if is_new and load_sample:
+            with open(SAMPLE_DATA_PATH, encoding='utf-8') as f:
+                db.executescript(f.read())
+    finally:
+        db.close()
+    return applied
+
+
+db_cli = AppGroup('db', help='Manage the task database.')
+
+
+@db_cli.command('upgrade')
+def upgrade_command():
+    '''
+    Apply missing migrations, existing data is kept.
+    '''
+    applied = upgrade_db(current_app.config['DATABASE'])
+    for name in applied:
+        click.echo(f'Applied {name}')
+    click.echo(f'Database is up to date ({len(applied)} applied).')
+
+
+@db_cli.command('init')
+@click.option('--sample/--no-sample', default=True,
+              help='Load sample data after creating the schema.')
+def init_command(sample: bool):
+    '''
+    Remove the database and create it from scratch.
+    '''
+    init_db(Path(current_app.config['DATABASE']).parent, load_sample=sample)
+    click.echo('Initialized the database.')
@@ -0,0 +1,344 @@
+from flask import Flask, Response, current_app, g, request
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Iterable
+import logging
+import sqlite3
+import threading
+import time
+
+# upper bounds (seconds) of the histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    '''
+    Description
+    -----------
+    sqlite3 connection that counts and times its statements.
+    Used as the factory of the pooled connections (see db.get_pool),
+    the counters are reset when the connection is checked out.
+
+    Only the execute call is timed: rows fetched later from the cursor
+    (i.e. streamed responses) are not included.
+
+    Statements slower than slow_query_seconds are written to
+    slow_query_log with their query plan (see init_app).
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slow_query_seconds = None
+        self.slow_query_log = None
+        self.reset()
+
+    def reset(self):
+        '''
+        Set the query count and time to 0.
+        '''
+        self.queries = 0
+        self.seconds = 0.0
+
+    def record(self, sql: str, parameters, seconds: float):
+        '''
+        Add a finished statement to the counters.
+        '''
+        self.queries += 1
+        self.seconds += seconds
+        if self.slow_query_log is not None and \
+                seconds >= self.slow_query_seconds:
+            self.log_slow_query(sql, parameters, seconds)
+
+    def log_slow_query(self, sql: str, parameters, seconds: float):
+        '''
+        Write a statement, its parameters, duration and query plan
+        to the slow query log.
+        '''
+        plan = []
+        # the parameters of executemany are consumed already
+        if parameters is not None:
+            try:
+                plan = explain(self, sql, parameters)
+            except sqlite3.Error as e:
+                plan = [f'(no plan: {e})']
+        self.slow_query_log.warning(
+            'slow query %.1f ms\nsql: %s\nparameters: %r\nplan:\n%s\n',
+            seconds * 1000, ' '.join(sql.split()), parameters,
+            '\n'.join(plan) or '(none)')
+
+    def execute(self, sql: str, parameters=(), /) -> sqlite3.Cursor:
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.record(sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql: str, parameters, /) -> sqlite3.Cursor:
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            self.record(sql, None, time.perf_counter() - start)
+
+    def executescript(self, script: str, /) -> sqlite3.Cursor:
+        start = time.perf_counter()
+        try:
+            return super().executescript(script)
+        finally:
+            self.record(script, None, time.perf_counter() - start)
+
+
+def explain(conn: sqlite3.Connection, sql: str, parameters=()) -> list[str]:
+    '''
+    Description
+    -----------
+    Return the EXPLAIN QUERY PLAN of a statement, one line per step,
+    indented by the nesting of the steps. The statement is not run.
+
+    Parameters
+    ---------
+    conn: sqlite3.Connection
+
+    sql: str
+    a single statement.
+
+    parameters: tuple | dict
+    the values bound to the statement.
+
+    Returns
+    --------
+    plan: list[str]
+    i.e. ['SEARCH task USING INTEGER PRIMARY KEY (rowid=?)']
+    '''
+    cursor = sqlite3.Connection.execute(conn, f'EXPLAIN QUERY PLAN {sql}',
+                                        parameters)
+    level = {0: -1}
+    plan = []
+    for id, parent, _, detail in cursor.fetchall():
+        level[id] = level.get(parent, -1) + 1
+        plan.append('  ' * level[id] + detail)
+    return plan
+
+
+class Histogram:
+    '''
+    Description
+    -----------
+    Cumulative histogram in the Prometheus format.
+    '''
+
+    def __init__(self, buckets: Iterable[float] = BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    '''
+    Description
+    -----------
+    Per endpoint request metrics of one app: request duration and
+    database time histograms, number of responses by status and
+    number of sql statements.
+    '''
+
+    def __init__(self):
+        self.durations = {}
+        self.db_durations = {}
+        self.responses = {}
+        self.queries = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint: str, method: str, status: int,
+                seconds: float, db_seconds: float, queries: int):
+        '''
+        Add a finished request.
+        '''
+        key = (endpoint, method)
+        with self._lock:
+            self.durations.setdefault(key, Histogram()).observe(seconds)
+            self.db_durations.setdefault(key, Histogram()).observe(
+                db_seconds)
+            self.queries[key] = self.queries.get(key, 0) + queries
+            status_key = (endpoint, method, str(status))
+            self.responses[status_key] = \
+                self.responses.get(status_key, 0) + 1
+
+    def render(self, cache_stats: dict | None = None) -> str:
+        '''
+        Return all metrics in the Prometheus text format.
+        '''
+        lines = []
+        with self._lock:
+            for name, help, histograms in (
+                    ('todo_request_duration_seconds',
+                     'Request duration by endpoint.', self.durations),
+                    ('todo_db_duration_seconds',
+                     'Time spent in sql statements per request.',
+                     self.db_durations)):
+                lines += [f'# HELP {name} {help}',
+                          f'# TYPE {name} histogram']
+                for key, histogram in sorted(histograms.items()):
+                    labels = format_labels(('endpoint', 'method'), key)
+                    for bound, count in zip(histogram.buckets,
+                                            histogram.counts):
+                        lines.append(f'{name}_bucket{{{labels},'
+                                     f'le="{bound}"}} {count}')
+                    lines += [
+                        f'{name}_bucket{{{labels},le="+Inf"}} '
+                        f'{histogram.count}',
+                        f'{name}_sum{{{labels}}} {histogram.sum:.6f}',
+                        f'{name}_count{{{labels}}} {histogram.count}']
+            lines += ['# HELP todo_db_queries_total '
+                      'Number of sql statements by endpoint.',
+                      '# TYPE todo_db_queries_total counter']
+            for key, count in sorted(self.queries.items()):
+                labels = format_labels(('endpoint', 'method'), key)
+                lines.append(f'todo_db_queries_total{{{labels}}} {count}')
+            lines += ['# HELP todo_responses_total '
+                      'Number of responses by endpoint and status.',
+                      '# TYPE todo_responses_total counter']
+            for key, count in sorted(self.responses.items()):
+                labels = format_labels(('endpoint', 'method', 'status'),
+                                       key)
+                lines.append(f'todo_responses_total{{{labels}}} {count}')
+        if cache_stats is not None:
+            for stat, type in (('hits', 'counter'), ('misses', 'counter'),
+                               ('entries', 'gauge')):
+                name = f'todo_task_cache_{stat}' + \
+                    ('_total' if type == 'counter' else '')
+                lines += [f'# TYPE {name} {type}',
+                          f'{name} {cache_stats[stat]}']
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(names: tuple, values: tuple) -> str:
+    '''
+    Format label pairs, i.e. endpoint="api.task_by_id",method="GET"
+    '''
+    return ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values))
+
+
+def init_app(app: Flask):
+    '''
+    Description
+    -----------
+    Attach a Metrics registry to the app and time every request.
+    Responses get a Server-Timing header with the database time,
+    the number of sql statements and the total time of the request.
+
+    Does nothing if the SQL_METRICS config is False.
+
+    If SLOW_QUERY_MS is set, statements taking at least that many
+    milliseconds are written to SLOW_QUERY_LOG (a rotating log file in
+    the instance folder) with their parameters and query plan.
+
+    Parameters
+    ---------
+    app: Flask
+
+    Returns
+    --------
+    None
+    '''
+    if app.config.get('SLOW_QUERY_MS'):
+        logger = logging.Logger(f'{app.name}.slow_queries')
+        handler = RotatingFileHandler(
+            Path(app.instance_path) / app.config.get(
+                'SLOW_QUERY_LOG', 'slow_queries.log'),
+            maxBytes=app.config.get('SLOW_QUERY_LOG_BYTES', 1024 * 1024),
+            backupCount=3, encoding='utf-8', delay=True)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        logger.addHandler(handler)
+        app.extensions['slow_query_log'] = (
+            app.config['SLOW_QUERY_MS'] / 1000, logger)
+    if not app.config.get('SQL_METRICS', True):
+        return
+    app.extensions['metrics'] = Metrics()
+    app.before_request(start_timer)
+    app.after_request(record_request)
+
+
+def get_metrics() -> Metrics | None:
+    '''
+    Description
+    -----------
+    Return the Metrics registry of the current app
+    (None if SQL_METRICS is False).
+
+    Parameters
+    ---------
+    None
+
+    Returns
+    --------
+    metrics: Metrics | None
+    '''
+    return current_app.extensions.get('metrics')
+
+
+def prepare_connection(conn: InstrumentedConnection):
+    '''
+    Description
+    -----------
+    Reset the counters of a checked out connection and apply the
+    slow query settings of the current app.
+
+    Parameters
+    ---------
+    conn: InstrumentedConnection
+
+    Returns
+    --------
+    None
+    '''
+    conn.reset()
+    conn.slow_query_seconds, conn.slow_query_log = \
+        current_app.extensions.get('slow_query_log', (None, None))
+
+
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+def record_request(response: Response) -> Response:
+    '''
+    Description
+    -----------
+    Add the Server-Timing header and record the request in the registry.
+
+    Parameters
+    ---------
+    response: flask.Response
+
+    Returns
+    --------
+    response: flask.Response
+    '''
+    seconds = time.perf_counter() - g.pop('request_start',
+                                          time.perf_counter())
+    db = g.get('db')
+    if isinstance(db, InstrumentedConnection):
+        queries, db_seconds = db.queries, db.seconds
+    else:
+        queries, db_seconds = 0, 0.0
+    response.headers.add(
+        'Server-Timing',
+        f'db;dur={db_seconds * 1000:.3f};desc="{queries} queries", '
+        f'total;dur={seconds * 1000:.3f}')
+    endpoint = request.endpoint or 'not_found'
+    get_metrics().observe(endpoint, request.method, response.status_code,
+                          seconds, db_seconds, queries)
+    return response
@@ -0,0 +1,189 @@
+from flask import Flask, current_app
+from werkzeug.middleware.profiler import ProfilerMiddleware
+from pathlib import Path
+from typing import Callable, Iterable
+from urllib.parse import parse_qs
+import os
+
+# values of the profile query parameter / X-Profile header that don't
+# turn the profiler on
+OFF_VALUES = ('0', 'false', 'no')
+
+
+class RequestProfiler:
+    '''
+    Description
+    -----------
+    WSGI middleware that runs single requests under cProfile
+    (werkzeug's ProfilerMiddleware) and writes the stats to
+    <folder>/<ms timestamp>.<method>.<path>.<duration>ms.pstats
+
+    A request is profiled when it has the X-Profile header or the
+    profile query parameter (i.e. /?profile=1) and it is sent from
+    one of the allowed client addresses. The response body is read
+    completely inside the profiler, streamed responses included.
+    Only the newest keep files are kept.
+
+    Parameters
+    ---------
+    wsgi_app: Callable
+    the wrapped WSGI app (Flask.wsgi_app).
+
+    folder: str | Path
+    where the .pstats files are written.
+
+    allowed: Iterable[str]
+    client addresses (REMOTE_ADDR) that can request a profile.
+
+    keep: int. Default 50
+    '''
+
+    def __init__(self, wsgi_app: Callable, folder: str | Path,
+                 allowed: Iterable[str], keep: int = 50):
+        self.wsgi_app = wsgi_app
+        self.folder = Path(folder)
+        self.allowed = set(allowed)
+        self.keep = keep
+        self.profiler = ProfilerMiddleware(
+            wsgi_app, stream=None, profile_dir=str(self.folder),
+            filename_format=self.filename)
+
+    @staticmethod
+    def filename(environ: dict) -> str:
+        '''
+        Name of the stats file of a finished request.
+        '''
+        stats = environ['werkzeug.profiler']
+        path = environ['PATH_INFO'].strip('/').replace('/', '.') or 'root'
+        return (f"{int(stats['time'] * 1000)}.{environ['REQUEST_METHOD']}."
+                f"{path}.{stats['elapsed']:.0f}ms.pstats")
+
+    def wants_profile(self, environ: dict) -> bool:
+        '''
+        Check the trigger and the client address of a request.
+        '''
+        if environ.get('REMOTE_ADDR') not in self.allowed:
+            return False
+        value = environ.get('HTTP_X_PROFILE')
+        if value is None:
+            values = parse_qs(environ.get('QUERY_STRING', ''),
+                              keep_blank_values=True).get('profile')
+            value = values[-1] if values else None
+        return value is not None and \
+            value.strip().lower() not in OFF_VALUES
+
+    def __call__(self, environ: dict, start_response: Callable):
+        if not self.wants_profile(environ):
+            return self.wsgi_app(environ, start_response)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        response = self.profiler(environ, start_response)
+        for path in list_profiles(self.folder)[self.keep:]:
+            path.unlink(missing_ok=True)
+        return response
+
+
+def list_profiles(folder: str | Path) -> list[Path]:
+    '''
+    Description
+    -----------
+    List the .pstats files of a folder, newest first.
+
+    Parameters
+    ---------
+    folder: str | Path
+
+    Returns
+    --------
+    paths: list[Path]
+    '''
+    if not os.path.isdir(folder):
+        return []
+    # names start with a millisecond timestamp
+    return sorted(Path(folder).glob('*.pstats'),
+                  key=lambda path: int(path.name.partition('.')[0]),
+                  reverse=True)
+
+
+def describe_profile(path: Path) -> dict:
+    '''
+    Description
+    -----------
+    Read the request details from the name of a stats file.
+
+    Parameters
+    ---------
+    path: Path
+
+    Returns
+    --------
+    profile: dict
+    name, time (ms timestamp), method, path, elapsed_ms and size.
+    '''
+    time, method, rest = path.name.split('.', 2)
+    request_path, _, elapsed = rest[:-len('ms.pstats')].rpartition('.')
+    return {'name': path.name, 'time': int(time), 'method': method,
+            'path': '/' + request_path.replace('.', '/')
+            if request_path != 'root' else '/',
+            'elapsed_ms': int(elapsed), 'size': path.stat().st_size}
+
+
+def init_app(app: Flask):
+    '''
+    Description
+    -----------
+    Wrap the WSGI app in a RequestProfiler if the PROFILER config is
+    True. Profiles are written to PROFILER_DIR in the instance folder,
+    requests are only profiled for PROFILER_ALLOWED client addresses.
+
+    Parameters
+    ---------
+    app: Flask
+
+    Returns
+    --------
+    None
+    '''
+    if not app.config.get('PROFILER', False):
+        return
+    app.wsgi_app = RequestProfiler(
+        app.wsgi_app, get_folder(app),
+        app.config.get('PROFILER_ALLOWED', ('127.0.0.1', '::1')),
+        keep=app.config.get('PROFILER_KEEP', 50))
+
+
+def get_folder(app: Flask | None = None) -> Path:
+    '''
+    Description
+    -----------
+    Return the folder of the profiles of the app (default current_app).
+
+    Parameters
+    ---------
+    app: Flask
+
+    Returns
+    --------
+    folder: Path
+    '''
+    app = app or current_app
+    return Path(app.instance_path) / app.config.get('PROFILER_DIR',
+                                                    'profiles')
+
+
+def is_allowed(remote_addr: str | None) -> bool:
+    '''
+    Description
+    -----------
+    Check if the profiler is enabled for a client address.
+
+    Parameters
+    ---------
+    remote_addr: str | None
+
+    Returns
+    --------
+    allowed: bool
+    '''
+    config = current_app.config
+    return bool(config.get('PROFILER', False)) and remote_addr in \
+        config.get('PROFILER_ALLOWED', ('127.0.0.1', '::1'))
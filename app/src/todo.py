@@ -1,39 +1,52 @@
 from flask import (
     Blueprint, request, render_template, redirect, url_for)
 from app.src import api
+from app.src.cache import cached
+from app.src.utils import conditional_get, build_trees, add_progress
 bp = Blueprint('todo', __name__)
 
 
 @bp.route('/')
+@conditional_get
 def show_all():
-    data, _ = api.get_task(id=None, mode='all')
-    trees = tasks_to_trees(data['tasks'])
-    # this option is for setting the parent task for a new added task.
-    parent_options = list_parent_options(data['tasks'])
-    return render_template('index.html', tasks=trees,
-                           parents=parent_options)
+    def build():
+        data, _ = api.get_task(id=None, mode='all')
+        # progress of every subtree, counted from the rows already read
+        return add_progress(tasks_to_trees(data['tasks']))
+    # the assembled forest is reused until the next write
+    # parent task options are loaded on demand (api.search_parents)
+    trees = cached(('show_all',), build)
+    return render_template('index.html', tasks=trees)
 
 
 @bp.route('/<id>')
+@conditional_get
 def show_task(id):
-    data, _ = api.get_task(id, mode='tree')
-    trees = tasks_to_trees(data['tasks'])
-    if trees:
-        tree = trees[0]
-    else:
+    def build():
+        data, _ = api.get_task(id, mode='tree')
+        trees = tasks_to_trees(data['tasks'])
+        if not trees:
+            return None
+        # current parent of the task, other options for changing the
+        # parent task are loaded on demand (api.search_parents)
+        parents, _ = api.get_tasks([trees[0]['parent_id']])
+        parent = parents['tasks'][0] if parents['tasks'] else None
+        # this option is for setting the parent task for a new added task.
+        add_task_options = list_parent_options(data['tasks'])
+        return trees[0], parent, add_task_options
+    view = cached(('show_task', id), build)
+    if view is None:
         return '', 204
-    # this option is for changing the parent task for the current task.
-    edit_task_options, _ = api.get_available_parent(id)
-    # this option is for setting the parent task for a new added task.
-    add_task_options = list_parent_options(data['tasks'])
+    tree, parent, add_task_options = view
     return render_template('single_task.html', main_task=tree,
                            tasks=tree.get('sub_tasks', []),
-                           edit_parents=edit_task_options['options'],
+                           parent=parent,
                            new_parents=add_task_options
                            )
 
 
 @bp.route('/filter')
+@conditional_get
 def filter():
     mode = request.args.get('mode', '', str).lower()
     if mode == 'ongoing':
@@ -46,10 +59,8 @@ def filter():
         # if mode is a weird value, then query all tasks
         data, _ = api.get_task(id=None, mode='all')
 
-    # add lineage information to tasks
-    for task in data['tasks']:
-        lineage, _ = api.show_lineage(task['id'])
-        task.update(lineage)
+    # add lineage information to tasks (resolved in one query)
+    api.add_lineage(data['tasks'])
 
     return render_template('filter.html', tasks=data['tasks'])
 
@@ -68,7 +79,8 @@ def handle_submit():
             data[key] = None
 
     if process == 'delete':
-        api.delete_task(data['id'])
+        cascade = request.args.get('cascade', data.get('cascade'))
+        api.delete_task(data['id'], cascade=str(cascade).lower() == 'true')
         return redirect(request.environ.get('HTTP_REFERER', '/'))
     elif process == 'edit':
         api.patch_task(id=data['id'], data=data)
@@ -84,7 +96,7 @@ def tasks_to_trees(tasks: list[dict]) -> list[dict]:
     -----------
     Reformat the queried data into a tree format.
     Task are linked based on parent_id and organized under
-    the sub_task key.
+    the sub_task key. (see utils.build_trees, tasks are not modified)
 
     Parameters
     ---------
@@ -99,20 +111,7 @@ def tasks_to_trees(tasks: list[dict]) -> list[dict]:
          'sub_tasks': [{'id': 3, 'title': 'Sub_task_1'}]
          }
     '''
-    task_dict = {task['id']: task for task in tasks}
-    root_tasks = []
-
-    for task in tasks:
-        if task['Level'] != 1:
-            parent = task_dict.get(task['parent_id'])
-            if parent is not None:
-                if 'sub_tasks' not in parent:
-                    parent['sub_tasks'] = []
-                parent['sub_tasks'].append(task_dict[task['id']])
-        else:
-            root_tasks.append(task_dict[task['id']])
-
-    return root_tasks
+    return build_trees(tasks)
 
 
 def list_parent_options(tasks: list[dict]) -> list[dict]:
@@ -1,4 +1,7 @@
-from flask import Response, jsonify
+from flask import Response, jsonify, make_response, request, session
+from functools import wraps
+from typing import Callable
+from .db import get_data_version
 
 
 def build_response(data: dict, status_code: int = 200) -> Response:
@@ -22,3 +25,137 @@ def build_response(data: dict, status_code: int = 200) -> Response:
     response = jsonify(data)
     response.status_code = status_code
     return response
+
+
+def build_trees(tasks: list[dict]) -> list[dict]:
+    '''
+    Description
+    -----------
+    Nest a flat list of tasks into trees in linear time.
+    Tasks are linked based on parent_id and organized under
+    the sub_tasks key. Tasks whose parent is not in the list
+    become root tasks. The input dictionaries are not modified,
+    every node in the result is a copy.
+
+    Parameters
+    ---------
+    tasks: list[dict]
+    Flat tasks with id and parent_id, in any order.
+
+    Returns
+    --------
+    trees: list[dict]
+    Root tasks in input order, with sub_tasks in input order.
+    Tasks without sub tasks have no sub_tasks key.
+    '''
+    nodes = {task['id']: dict(task) for task in tasks}
+    roots = []
+    for task in tasks:
+        node = nodes[task['id']]
+        parent = nodes.get(task['parent_id'])
+        if parent is None or parent is node:
+            roots.append(node)
+        else:
+            parent.setdefault('sub_tasks', []).append(node)
+    return roots
+
+
+def add_progress(trees: list[dict]) -> list[dict]:
+    '''
+    Description
+    -----------
+    Count the tasks in each status for the subtree of every node of
+    nested trees (see build_trees) in one bottom-up pass, the same
+    counts as api.get_stats but without a query. The counts are added
+    to the nodes under the progress key (the nodes are modified).
+
+    Parameters
+    ---------
+    trees: list[dict]
+    nested tasks with id and status. Subtrees are counted from the
+    nodes in the trees only.
+
+    Returns
+    --------
+    trees: list[dict]
+    the same trees, every node has progress
+    {'id', 'total', 'empty', 'half', 'full'}
+    '''
+    # parents before children, so reversed it is bottom-up
+    order = []
+    stack = list(trees)
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(node.get('sub_tasks', ()))
+    for node in reversed(order):
+        status = node['status']
+        total, empty = 1, int(status == 'EMPTY')
+        half, full = int(status == 'HALF'), int(status == 'FULL')
+        for child in node.get('sub_tasks', ()):
+            progress = child['progress']
+            total += progress['total']
+            empty += progress['empty']
+            half += progress['half']
+            full += progress['full']
+        node['progress'] = {'id': node['id'], 'total': total,
+                            'empty': empty, 'half': half, 'full': full}
+    return trees
+
+
+def data_etag() -> str:
+    '''
+    Description
+    -----------
+    Build the ETag of the current task data from the persisted data
+    version (see db.get_data_version). The version changes on every
+    write, from any process, so the ETag changes whenever any task
+    changes.
+
+    Parameters
+    ---------
+    None
+
+    Returns
+    --------
+    etag: str
+    '''
+    return get_data_version()
+
+
+def conditional_get(view: Callable) -> Callable:
+    '''
+    Description
+    -----------
+    Decorator for views that only depend on the task data.
+    GET responses get an ETag (see data_etag) and requests with a
+    matching If-None-Match header get 304 Not Modified without
+    running the view (the only query is the data version lookup).
+
+    Responses are marked no-cache so browsers revalidate every time.
+    Pending flash messages skip the check so they are always rendered.
+
+    Parameters
+    ---------
+    view: Callable
+    flask view function.
+
+    Returns
+    --------
+    wrapper: Callable
+    '''
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET' or '_flashes' in session:
+            return view(*args, **kwargs)
+        etag = data_etag()
+        if request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
+    return wrapper
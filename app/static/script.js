@@ -1,10 +1,14 @@
 // function to change the filltype of the checkbox send status to API
-function toggleCheckbox(checkbox) {
+// if withSubTasks is true, all the sub tasks get the same status.
+function toggleCheckbox(checkbox, withSubTasks = false) {
   const fillType = checkbox.classList[1];
   const taskId = checkbox.getAttribute('data-task-id')
   const newFillType =
     fillType === 'empty' ? 'half' : fillType === 'half' ? 'full' : 'empty';
-  const data = {
+  const data = withSubTasks ? {
+    status: newFillType.toUpperCase(),
+    root: Number(taskId)
+  } : {
     status: newFillType.toUpperCase(),
     id: taskId
   };
@@ -13,7 +17,8 @@ function toggleCheckbox(checkbox) {
   checkbox.classList.replace(fillType, newFillType);
 
   // API call
-  fetch(`/api/v1/tasks?id=${taskId}`, {
+  const url = withSubTasks ? '/api/v1/tasks/status' : `/api/v1/tasks?id=${taskId}`;
+  fetch(url, {
     method: 'PATCH', // or 'GET' if your endpoint expects a GET request
     headers: {
       'Content-Type': 'application/json',
@@ -39,10 +44,11 @@ function toggleCheckbox(checkbox) {
 }
 
 // Change checkbox status if checkbox is clicked.
+// Shift + click changes the status of the task and all its sub tasks.
 const checkboxes = document.querySelectorAll('.checkbox');
 checkboxes.forEach(function (element) {
-  element.addEventListener('click', () => {
-    toggleCheckbox(element);
+  element.addEventListener('click', (event) => {
+    toggleCheckbox(element, event.shiftKey);
   })
 });
 
@@ -59,4 +65,47 @@ taskTitles.forEach(function (element) {
     const taskId = element.getAttribute('data-task-id')
     window.location.href = `/${taskId}`;
   })
-});
\ No newline at end of file
+});
+
+// Typeahead for the parent task inputs.
+// Options are fetched from the API while typing (debounced),
+// the chosen "Title #id" is copied into the hidden parent_id input.
+const parentPickers = document.querySelectorAll('.parent-picker');
+parentPickers.forEach(function (input) {
+  const target = document.getElementById(input.getAttribute('data-target'));
+  const datalist = document.getElementById(input.getAttribute('list'));
+  const exclude = input.getAttribute('data-exclude');
+  let timer = null;
+
+  function loadOptions() {
+    const params = new URLSearchParams({ q: input.value.replace(/ #\d*$/, '') });
+    if (exclude) {
+      params.set('id', exclude);
+    }
+    fetch(`/api/v1/tasks/parents?${params}`)
+      .then(response => response.json())
+      .then(data => {
+        datalist.replaceChildren(...data.options.map(option => {
+          const element = document.createElement('option');
+          element.value = `${option.title} #${option.id}`;
+          return element;
+        }));
+      })
+      .catch(error => console.error('Error:', error));
+  }
+
+  input.addEventListener('input', () => {
+    const match = input.value.match(/#(\d+)$/);
+    if (input.value === '') {
+      target.value = '';
+      input.setCustomValidity('');
+    } else if (match) {
+      target.value = match[1];
+      input.setCustomValidity('');
+    } else {
+      input.setCustomValidity('Pick a parent task from the list.');
+    }
+    clearTimeout(timer);
+    timer = setTimeout(loadOptions, 200);
+  });
+});
@@ -0,0 +1,103 @@
+'''
+Synthetic task forests for the benchmarks.
+'''
+from sqlite3 import Connection
+from app.src import api
+import random
+
+STATUSES = ('EMPTY', 'HALF', 'FULL')
+# most tasks of a real list are not started yet
+STATUS_WEIGHTS = (0.6, 0.15, 0.25)
+
+# root_rate: chance of a task to start a new project
+# window: parents are picked from the last window tasks (None: any task)
+# max_depth: tasks at this Level don't get sub tasks
+SHAPES = {
+    # projects of a few hundred tasks, up to 8 levels
+    'mixed': {'root_rate': 0.005, 'window': 50, 'max_depth': 8},
+    # a few projects with thousands of direct sub tasks
+    'wide': {'root_rate': 0.001, 'window': None, 'max_depth': 2},
+    # chains of single sub tasks, 100 levels deep
+    'deep': {'root_rate': 0.0, 'window': 1, 'max_depth': 100},
+}
+
+VERBS = ['Plan', 'Buy', 'Cut', 'Sand', 'Paint', 'Check', 'Order', 'Build',
+         'Measure', 'Clean', 'Fix', 'Write', 'Call', 'Draw', 'Assemble']
+NOUNS = ['wood', 'legs', 'table top', 'drawer', 'screws', 'finish', 'frame',
+         'shelf', 'invoice', 'design', 'garden', 'door', 'lamp', 'boxes']
+
+
+def generate_forest(size: int, shape: str = 'mixed', seed: int = 0,
+                    status_weights: tuple = STATUS_WEIGHTS) -> list[dict]:
+    '''
+    Description
+    -----------
+    Generate a reproducible forest of tasks.
+    Parents are always generated before their sub tasks.
+
+    Parameters
+    ---------
+    size: int
+    number of tasks.
+
+    shape: ['mixed', 'wide', 'deep']. Default mixed
+    see SHAPES.
+
+    seed: int. Default 0
+
+    status_weights: tuple. Default STATUS_WEIGHTS
+    relative weights of EMPTY, HALF and FULL.
+
+    Returns
+    --------
+    rows: list[dict]
+    rows in the format of api.insert_task_rows.
+    '''
+    rng = random.Random(seed)
+    config = SHAPES[shape]
+    root_rate = config['root_rate']
+    window, max_depth = config['window'], config['max_depth']
+    depth = {}
+    # tasks that can still get sub tasks, in creation order
+    eligible = []
+    rows = []
+    for ref in range(1, size + 1):
+        if window is None:
+            candidates = eligible
+        else:
+            candidates = [candidate for candidate in eligible[-window:]
+                          if candidate >= ref - window]
+        if not candidates or rng.random() < root_rate:
+            parent = None
+            depth[ref] = 0
+        else:
+            parent = rng.choice(candidates)
+            depth[ref] = depth[parent] + 1
+        if depth[ref] < max_depth:
+            eligible.append(ref)
+        rows.append({'ref': ref, 'parent_ref': parent,
+                     'title': f'{rng.choice(VERBS)} {rng.choice(NOUNS)} '
+                              f'{ref}',
+                     'status': rng.choices(STATUSES, status_weights)[0]})
+    return rows
+
+
+def load_forest(db: Connection, rows: list[dict]) -> dict:
+    '''
+    Description
+    -----------
+    Insert a generated forest (needs an app context).
+
+    Parameters
+    ---------
+    db: sqlite3.Connection
+
+    rows: list[dict]
+    rows from generate_forest.
+
+    Returns
+    --------
+    ids: dict
+    map each ref to the id of the inserted task.
+    '''
+    return api.insert_task_rows(db, rows)
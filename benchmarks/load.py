@@ -0,0 +1,297 @@
+'''
+Drive the app through a real local WSGI server with concurrent clients.
+
+    python -m benchmarks.load --clients 16 --duration 10
+    python -m benchmarks.load --server processes --workers 8
+    python -m benchmarks.load --mix index=1,get=6,toggle=3
+    python -m benchmarks.load --url http://127.0.0.1:5000
+
+The server runs werkzeug's make_server in a separate process, either
+threaded (one process, a thread per request, shared connection pool and
+cache) or forking (a process per request, at most --workers at a time).
+Clients are threads sending requests back to back. Throughput, latency
+percentiles and the number of "database is locked" errors (503) are
+reported per operation.
+'''
+from app.flask_app import create_app
+from app.src.db import init_db, get_db, close_pool
+from benchmarks.forest import generate_forest, load_forest, SHAPES
+from benchmarks.run import percentile
+from werkzeug.serving import make_server
+from typing import Callable
+import argparse
+import http.client
+import json
+import logging
+import multiprocessing
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+# default share of each operation
+MIX = {'index': 1, 'filter': 1, 'get': 5, 'toggle': 2, 'insert': 1}
+
+
+def operations(size: int) -> dict[str, Callable]:
+    '''
+    Description
+    -----------
+    Build the requests of each operation of the mix.
+
+    Parameters
+    ---------
+    size: int
+    number of tasks in the database (ids are picked from 1 to size).
+
+    Returns
+    --------
+    operations: dict
+    map each operation name to a function returning
+    (method, path, json body or None).
+    '''
+    def task_id():
+        return random.randint(1, size)
+
+    return {
+        'index': lambda: ('GET', '/', None),
+        'filter': lambda: ('GET', '/filter?mode=ongoing', None),
+        'get': lambda: ('GET', f'/api/v1/tasks?id={task_id()}', None),
+        'toggle': lambda: ('PATCH', f'/api/v1/tasks?id={task_id()}',
+                           {'status': random.choice(['EMPTY', 'HALF',
+                                                     'FULL'])}),
+        'insert': lambda: ('POST', '/api/v1/tasks',
+                           {'title': 'load test', 'parent_id': task_id()}),
+    }
+
+
+def serve(config: dict, queue: multiprocessing.Queue):
+    '''
+    Description
+    -----------
+    Server process: create the database with a generated forest
+    and serve the app until terminated. The port is sent to queue.
+
+    Parameters
+    ---------
+    config: dict
+    size, shape, server, workers, busy_timeout and cache.
+
+    queue: multiprocessing.Queue
+    '''
+    folder = tempfile.mkdtemp()
+    forking = config['server'] == 'processes'
+    app = create_app({
+        'TESTING': False,
+        'DB_BUSY_TIMEOUT': config['busy_timeout'],
+        'TASK_CACHE_SIZE': 128 if config['cache'] else 0,
+    }, instance_path=folder)
+    with app.app_context():
+        init_db(folder, load_sample=False)
+        load_forest(get_db(), generate_forest(config['size'],
+                                              config['shape']))
+    # forked workers open their own connections
+    close_pool(app.config['DATABASE'])
+    # no access log line per request
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app,
+                         threaded=not forking,
+                         processes=config['workers'] if forking else 1)
+    queue.put(server.server_port)
+    server.serve_forever()
+
+
+def client(url: str, ops: dict, names: list[str], weights: list[int],
+           deadline: float, results: list):
+    '''
+    Description
+    -----------
+    Send requests back to back until deadline and append
+    (operation, status, seconds, locked) to results.
+
+    Parameters
+    ---------
+    url: str
+    base url of the server.
+
+    ops: dict
+    from operations.
+
+    names: list[str]
+    weights: list[int]
+    the mix.
+
+    deadline: float
+    time.perf_counter() value to stop at.
+
+    results: list
+    '''
+    target = urllib.parse.urlsplit(url)
+    while time.perf_counter() < deadline:
+        name = random.choices(names, weights)[0]
+        method, path, body = ops[name]()
+        headers = {'Content-Type': 'application/json'} if body else {}
+        start = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection(target.hostname, target.port,
+                                              timeout=30)
+            conn.request(method, path, json.dumps(body) if body else None,
+                         headers)
+            response = conn.getresponse()
+            data = response.read()
+            conn.close()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            status, data = 0, b''
+        results.append((name, status, time.perf_counter() - start,
+                        b'database is locked' in data.lower()))
+
+
+def summarize(results: list, seconds: float) -> dict:
+    '''
+    Description
+    -----------
+    Throughput, latency percentiles and error counts
+    of all requests and of each operation.
+
+    Parameters
+    ---------
+    results: list
+    from client.
+
+    seconds: float
+    length of the run.
+
+    Returns
+    --------
+    summary: dict
+    '''
+    if not results:
+        return {'all': {'requests': 0}}
+    groups = {'all': results}
+    for result in results:
+        groups.setdefault(result[0], []).append(result)
+    summary = {}
+    for name, group in groups.items():
+        times = sorted(result[2] for result in group)
+        summary[name] = {
+            'requests': len(group),
+            'per_sec': round(len(group) / seconds, 1),
+            'p50_ms': round(percentile(times, 50) * 1000, 2),
+            'p95_ms': round(percentile(times, 95) * 1000, 2),
+            'p99_ms': round(percentile(times, 99) * 1000, 2),
+            'errors': sum(1 for result in group
+                          if not 200 <= result[1] < 400),
+            'locked': sum(1 for result in group if result[3])}
+        summary[name]['locked_rate'] = round(
+            summary[name]['locked'] / len(group), 4)
+    return summary
+
+
+def run(url: str | None = None, clients: int = 8, duration: float = 10,
+        mix: dict = MIX, size: int = 10000, shape: str = 'mixed',
+        server: str = 'threaded', workers: int = 4,
+        busy_timeout: int = 5000, cache: bool = True) -> dict:
+    '''
+    Description
+    -----------
+    Start a server (unless url is given) and run the clients.
+
+    Returns
+    --------
+    results: dict
+    meta (run settings) and summary (see summarize).
+    '''
+    process = None
+    if url is None:
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=serve, daemon=True, args=(
+            {'size': size, 'shape': shape, 'server': server,
+             'workers': workers, 'busy_timeout': busy_timeout,
+             'cache': cache}, queue))
+        process.start()
+        url = f'http://127.0.0.1:{queue.get(timeout=600)}'
+    try:
+        names, weights = list(mix), list(mix.values())
+        ops = operations(size)
+        results = []
+        start = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(
+            url, ops, names, weights, start + duration, results))
+            for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - start
+    finally:
+        if process is not None:
+            process.terminate()
+            process.join()
+    return {'meta': {'url': url, 'clients': clients, 'duration': duration,
+                     'mix': mix, 'size': size, 'shape': shape,
+                     'server': server if process else 'external',
+                     'workers': workers, 'busy_timeout': busy_timeout,
+                     'cache': cache},
+            'summary': summarize(results, seconds)}
+
+
+def parse_mix(text: str) -> dict:
+    '''
+    Parse "index=1,get=5" into {'index': 1, 'get': 5}.
+    '''
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in MIX:
+            raise argparse.ArgumentTypeError(f'Unknown operation {name}.')
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.load',
+        description='Load test the app through a local WSGI server.')
+    parser.add_argument('--url', help='test a running server instead')
+    parser.add_argument('--clients', type=int, default=8,
+                        help='concurrent clients (default 8)')
+    parser.add_argument('--duration', type=float, default=10,
+                        help='seconds (default 10)')
+    parser.add_argument('--mix', type=parse_mix, default=MIX,
+                        help='operation weights, i.e. get=5,toggle=2 '
+                             f'(operations: {", ".join(MIX)})')
+    parser.add_argument('--size', type=int, default=10000,
+                        help='tasks in the generated database')
+    parser.add_argument('--shape', choices=list(SHAPES), default='mixed')
+    parser.add_argument('--server', choices=['threaded', 'processes'],
+                        default='threaded')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='max forked workers (--server processes)')
+    parser.add_argument('--busy-timeout', type=int, default=5000,
+                        help='DB_BUSY_TIMEOUT in ms (default 5000)')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help='disable the task view cache')
+    parser.add_argument('--output', help='write the results to a json file')
+    args = parser.parse_args(argv)
+
+    results = run(args.url, args.clients, args.duration, args.mix,
+                  args.size, args.shape, args.server, args.workers,
+                  args.busy_timeout, args.cache)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    print(f"{'operation':10} {'requests':>9} {'req/s':>8} {'p50 ms':>8} "
+          f"{'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'locked':>7}")
+    if not results['summary']['all']['requests']:
+        sys.exit('No requests were sent.')
+    for name, row in results['summary'].items():
+        print(f"{name:10} {row['requests']:>9} {row['per_sec']:>8} "
+              f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8} "
+              f"{row['errors']:>7} {row['locked']:>7}")
+
+
+if __name__ == '__main__':
+    main()
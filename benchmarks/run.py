@@ -0,0 +1,387 @@
+'''
+Benchmark the api functions and the todo routes against a generated forest.
+
+    python -m benchmarks.run --size 10000 --shape mixed
+    python -m benchmarks.run --compare benchmarks/baseline.json
+    python -m benchmarks.run --output benchmarks/baseline.json
+
+Every scenario is called once to warm up, then --repeat times.
+Ops/sec, p50 and p99 come from the timed calls, the peak memory
+(tracemalloc) from one extra call.
+'''
+from app.flask_app import create_app
+from app.src import api
+from app.src.db import init_db, get_db, close_pool
+from benchmarks.forest import generate_forest, load_forest, SHAPES
+from flask import Flask
+from pathlib import Path
+from typing import Callable
+import argparse
+import json
+import math
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+class Scenario:
+    '''
+    Description
+    -----------
+    A named call to benchmark.
+
+    Parameters
+    ---------
+    name: str
+
+    run: Callable
+    the timed call. Receives the value returned by prepare (if any).
+
+    prepare: Callable. Default None
+    untimed setup before each call, i.e. creating the task to delete.
+    '''
+
+    def __init__(self, name: str, run: Callable,
+                 prepare: Callable | None = None):
+        self.name = name
+        self.run = run
+        self.prepare = prepare
+
+    def call(self) -> float:
+        '''
+        Run once and return the duration of the run in seconds.
+        '''
+        args = (self.prepare(),) if self.prepare else ()
+        start = time.perf_counter()
+        self.run(*args)
+        return time.perf_counter() - start
+
+
+def percentile(times: list[float], p: float) -> float:
+    '''
+    Nearest rank percentile of sorted durations.
+    '''
+    return times[max(0, math.ceil(p / 100 * len(times)) - 1)]
+
+
+def measure(scenario: Scenario, repeat: int) -> dict:
+    '''
+    Description
+    -----------
+    Time a scenario and measure its peak memory.
+
+    Parameters
+    ---------
+    scenario: Scenario
+
+    repeat: int
+    number of timed calls.
+
+    Returns
+    --------
+    result: dict
+    ops_per_sec, p50_ms, p99_ms and peak_kib.
+    '''
+    scenario.call()
+    times = sorted(scenario.call() for _ in range(repeat))
+    args = (scenario.prepare(),) if scenario.prepare else ()
+    tracemalloc.start()
+    try:
+        scenario.run(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'ops_per_sec': round(len(times) / sum(times), 2),
+            'p50_ms': round(percentile(times, 50) * 1000, 3),
+            'p99_ms': round(percentile(times, 99) * 1000, 3),
+            'peak_kib': round(peak / 1024, 1)}
+
+
+def pick_targets(app: Flask) -> dict:
+    '''
+    Description
+    -----------
+    Choose the tasks the scenarios work on: the largest project (root),
+    a task with sub tasks halfway down that project (mid), the deepest
+    task of the project (leaf) and 100 evenly spaced task ids (sample).
+
+    Parameters
+    ---------
+    app: Flask
+
+    Returns
+    --------
+    targets: dict
+    '''
+    with app.app_context():
+        db = get_db()
+        root = db.execute(
+            '''SELECT c.ancestor FROM task_closure c
+            INNER JOIN task t ON t.id = c.ancestor
+            WHERE t.parent_id IS NULL
+            GROUP BY c.ancestor
+            ORDER BY COUNT(*) DESC LIMIT 1''').fetchone()[0]
+        leaf, depth = db.execute(
+            '''SELECT descendant, depth FROM task_closure
+            WHERE ancestor = ? ORDER BY depth DESC LIMIT 1''',
+            (root,)).fetchone()
+        mid = db.execute(
+            '''SELECT c.descendant FROM task_closure c
+            INNER JOIN task t ON t.parent_id = c.descendant
+            WHERE c.ancestor = ? AND c.depth <= ?
+            ORDER BY c.depth DESC LIMIT 1''',
+            (root, max(depth // 2, 1))).fetchone()
+        count = db.execute('SELECT COUNT(*) FROM task').fetchone()[0]
+        sample = [row[0] for row in db.execute(
+            'SELECT id FROM task WHERE id % ? = 0 LIMIT 100',
+            (max(count // 100, 1),))]
+    return {'root': root, 'mid': mid[0] if mid else root, 'leaf': leaf,
+            'sample': sample}
+
+
+def build_scenarios(app: Flask, targets: dict) -> list[Scenario]:
+    '''
+    Description
+    -----------
+    One scenario per function of api.py (reads and writes)
+    and per route of todo.py.
+
+    Parameters
+    ---------
+    app: Flask
+
+    targets: dict
+    from pick_targets.
+
+    Returns
+    --------
+    scenarios: list[Scenario]
+    '''
+    root, mid, leaf = targets['root'], targets['mid'], targets['leaf']
+    sample = targets['sample']
+    client = app.test_client()
+
+    def in_app(function: Callable) -> Callable:
+        # a new app context (and pooled connection) like a request
+        def wrapper(*args):
+            with app.app_context():
+                return function(*args)
+        return wrapper
+
+    def get(url: str) -> Callable:
+        def wrapper():
+            response = client.get(url)
+            assert response.status_code == 200, (url, response.status)
+            return response.data
+        return wrapper
+
+    def sample_tasks():
+        with app.app_context():
+            return api.get_tasks(sample)[0]['tasks']
+
+    def new_subtree():
+        with app.app_context():
+            result, _ = api.post_tasks(
+                [{'id': 'top', 'title': 'bench', 'parent_id': mid,
+                  'sub_tasks': [{'title': f'bench {i}'}
+                                for i in range(9)]}])
+        return result['ids']['top']
+
+    toggle = {'status': 'EMPTY'}
+
+    def flip_status():
+        toggle['status'] = 'FULL' if toggle['status'] == 'EMPTY' \
+            else 'EMPTY'
+        return {'status': toggle['status']}
+
+    parents = {'next': root}
+
+    def flip_parent():
+        parents['next'] = mid if parents['next'] == root else root
+        return {'parent_id': parents['next']}
+
+    export_rows = [{'id': i, 'parent_id': i - 1 if i % 10 else None,
+                    'title': f'imported {i}'} for i in range(100)]
+
+    return [
+        # api reads
+        Scenario('api.get_task.tree', in_app(
+            lambda: api.get_task(mid, 'tree'))),
+        Scenario('api.get_task.single', in_app(
+            lambda: api.get_task(leaf, 'single'))),
+        Scenario('api.get_task.children', in_app(
+            lambda: api.get_task(root, 'children'))),
+        Scenario('api.get_task.nested', in_app(
+            lambda: api.get_task(mid, 'nested'))),
+        Scenario('api.get_task.all_page', in_app(
+            lambda: api.get_task(None, 'all', limit=100))),
+        Scenario('api.get_task.all', in_app(
+            lambda: api.get_task(None, 'all'))),
+        Scenario('api.get_tasks', in_app(lambda: api.get_tasks(sample))),
+        Scenario('api.get_stats.all', in_app(lambda: api.get_stats())),
+        Scenario('api.get_stats.subtree', in_app(
+            lambda: api.get_stats(root))),
+        Scenario('api.search_tasks', in_app(
+            lambda: api.search_tasks('paint'))),
+        Scenario('api.search_parents', in_app(
+            lambda: api.search_parents('pa', id=mid))),
+        Scenario('api.filter_task.page', in_app(
+            lambda: api.filter_task('HALF', limit=100))),
+        Scenario('api.filter_task', in_app(lambda: api.filter_task('HALF'))),
+        Scenario('api.show_lineage', in_app(lambda: api.show_lineage(leaf))),
+        Scenario('api.show_lineages', in_app(
+            lambda: api.show_lineages(sample))),
+        Scenario('api.add_lineage', in_app(api.add_lineage),
+                 prepare=sample_tasks),
+        Scenario('api.get_available_parent', in_app(
+            lambda: api.get_available_parent(mid))),
+        Scenario('api.export', in_app(
+            lambda: sum(1 for _ in api.iter_csv(*api.export_query(root))))),
+        Scenario('api.is_descendant', in_app(
+            lambda: api.is_descendant(get_db(), leaf, root))),
+        # api writes
+        Scenario('api.post_task', in_app(
+            lambda: api.post_task({'title': 'bench', 'parent_id': leaf}))),
+        Scenario('api.post_tasks', in_app(
+            lambda: api.post_tasks([{'title': f'bench {i}', 'parent_id': mid}
+                                    for i in range(100)]))),
+        Scenario('api.import_tasks', in_app(
+            lambda: api.import_tasks(export_rows, parent_id=mid))),
+        Scenario('api.patch_task.status', in_app(
+            lambda data: api.patch_task(leaf, data)), prepare=flip_status),
+        Scenario('api.patch_task.parent', in_app(
+            lambda data: api.patch_task(leaf, data)), prepare=flip_parent),
+        Scenario('api.patch_status', in_app(
+            lambda data: api.patch_status(data['status'], root=mid)),
+            prepare=flip_status),
+        Scenario('api.delete_task.cascade', in_app(
+            lambda id: api.delete_task(id, cascade=True)),
+            prepare=new_subtree),
+        # todo routes (cache disabled unless --cache)
+        Scenario('todo.show_all', get('/')),
+        Scenario('todo.show_task', get(f'/{mid}')),
+        Scenario('todo.filter.ongoing', get('/filter?mode=ongoing')),
+        Scenario('todo.filter.all', get('/filter')),
+    ]
+
+
+def compare(results: dict, baseline: dict) -> list[str]:
+    '''
+    Description
+    -----------
+    Format the p50 of each scenario next to the baseline.
+
+    Parameters
+    ---------
+    results: dict
+    baseline: dict
+    output of run (or the loaded baseline json).
+
+    Returns
+    --------
+    lines: list[str]
+    '''
+    lines = [f"{'scenario':32} {'base p50':>10} {'p50':>10} {'ratio':>7}"]
+    for name, result in results['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            lines.append(f"{name:32} {'-':>10} {result['p50_ms']:>10}")
+            continue
+        ratio = result['p50_ms'] / base['p50_ms'] if base['p50_ms'] else 0
+        lines.append(f"{name:32} {base['p50_ms']:>10} "
+                     f"{result['p50_ms']:>10} {ratio:>6.2f}x")
+    return lines
+
+
+def run(size: int = 10000, shape: str = 'mixed', seed: int = 0,
+        repeat: int = 10, only: str = '', cache: bool = False) -> dict:
+    '''
+    Description
+    -----------
+    Generate and load a forest into a temporary database
+    and measure every scenario.
+
+    Parameters
+    ---------
+    size: int. Default 10000
+    shape: ['mixed', 'wide', 'deep']. Default mixed
+    seed: int. Default 0
+    repeat: int. Default 10
+    only: str. Default '' (all scenarios)
+    only run scenarios whose name contains this string.
+    cache: bool. Default False
+    keep the task view cache enabled.
+
+    Returns
+    --------
+    results: dict
+    meta (run settings and versions) and results (per scenario).
+    '''
+    with tempfile.TemporaryDirectory() as folder:
+        app = create_app({'TESTING': True,
+                          'TASK_CACHE_SIZE': 128 if cache else 0},
+                         instance_path=folder)
+        start = time.perf_counter()
+        with app.app_context():
+            init_db(folder, load_sample=False)
+            load_forest(get_db(), generate_forest(size, shape, seed))
+        load_seconds = time.perf_counter() - start
+        targets = pick_targets(app)
+        results = {}
+        try:
+            for scenario in build_scenarios(app, targets):
+                if only in scenario.name:
+                    results[scenario.name] = measure(scenario, repeat)
+                    print(f'{scenario.name:32} {results[scenario.name]}',
+                          file=sys.stderr)
+        finally:
+            close_pool(app.config['DATABASE'])
+    return {'meta': {'size': size, 'shape': shape, 'seed': seed,
+                     'repeat': repeat, 'cache': cache,
+                     'load_seconds': round(load_seconds, 2),
+                     'python': platform.python_version(),
+                     'sqlite': sqlite3.sqlite_version},
+            'results': results}
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.run',
+        description='Benchmark the api and todo routes '
+                    'against a generated forest.')
+    parser.add_argument('--size', type=int, default=10000,
+                        help='number of tasks (default 10000)')
+    parser.add_argument('--shape', choices=list(SHAPES), default='mixed')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='timed calls per scenario (default 10)')
+    parser.add_argument('--only', default='',
+                        help='only run scenarios containing this string')
+    parser.add_argument('--cache', action='store_true',
+                        help='keep the task view cache enabled')
+    parser.add_argument('--output', type=Path,
+                        help='write the results to this json file')
+    parser.add_argument('--compare', type=Path,
+                        help='baseline json file to compare against')
+    args = parser.parse_args(argv)
+
+    results = run(args.size, args.shape, args.seed, args.repeat,
+                  args.only, args.cache)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + '\n')
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        if baseline['meta']['size'] != args.size or \
+                baseline['meta']['shape'] != args.shape:
+            print('Warning: the baseline used another forest '
+                  f"({baseline['meta']['size']} {baseline['meta']['shape']})")
+        print('\n'.join(compare(results, baseline)))
+    elif not args.output:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,7 @@ import os
 
 import pytest
 from app.flask_app import create_app
-from app.src.db import get_db, init_db
+from app.src.db import get_db, init_db, close_pool
 
 with open(os.path.join(os.path.dirname(__file__), 'data.sql'), 'r',
           encoding='utf-8') as f:
@@ -23,6 +23,7 @@ def app(tmp_path):
 
     yield app
 
+    close_pool(DB_PATH)
     os.remove(DB_PATH)
 
 
@@ -0,0 +1,55 @@
+from app.src.metrics import InstrumentedConnection, explain
+from contextlib import contextmanager
+from typing import Iterator
+import re
+
+
+@contextmanager
+def capture_queries(conn: InstrumentedConnection) -> Iterator[list]:
+    '''
+    Collect the (sql, parameters) of every statement run on conn.
+    Statements of executemany and executescript have parameters None.
+    '''
+    queries = []
+    record = conn.record
+
+    def capture(sql, parameters, seconds):
+        queries.append((sql, parameters))
+        record(sql, parameters, seconds)
+    conn.record = capture
+    try:
+        yield queries
+    finally:
+        del conn.record
+
+
+def table_scans(conn, sql: str, parameters=(), table: str = 'task'
+                ) -> list[str]:
+    '''
+    Return the steps of the query plan that read every row of table
+    (by name or by one of its aliases in sql).
+    '''
+    names = {table} | set(re.findall(
+        rf'\b{table}\s+(?:AS\s+)?(?!ON\b|WHERE\b|SET\b)(\w+)', sql,
+        re.IGNORECASE))
+    return [step for step in explain(conn, sql, parameters)
+            if re.match(r'\s*SCAN (\w+)', step) and
+            re.match(r'\s*SCAN (\w+)', step).group(1) in names]
+
+
+def assert_uses_index(conn, sql: str, parameters=(), table: str = 'task'):
+    '''
+    Fail if the query plan of sql scans the whole table
+    instead of searching it with an index.
+    '''
+    scans = table_scans(conn, sql, parameters, table)
+    assert not scans, f'{scans} in the plan of {" ".join(sql.split())}'
+
+
+def temp_sorts(conn, sql: str, parameters=()) -> list[str]:
+    '''
+    Return the steps of the query plan that sort rows in a temp b-tree
+    (all rows are read before the first one is returned).
+    '''
+    return [step for step in explain(conn, sql, parameters)
+            if 'USE TEMP B-TREE' in step]
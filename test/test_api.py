@@ -1,4 +1,8 @@
+import csv
+import io
 import json
+import sqlite3
+import pytest
 from app.flask_app import api
 
 
@@ -57,12 +61,20 @@ class Testrouting:
             Recorder.filter = filter
             return {}, 200
         monkeypatch.setattr('app.src.api.filter_task',
-                            lambda filter: fake_filter_task(filter))
+                            lambda filter, **kwargs: fake_filter_task(filter))
         response = client.get("/api/v1/tasks?filter=FULL")
         assert response.status_code == 200
         assert Recorder.called
         assert Recorder.filter == 'full'
 
+    @staticmethod
+    def test_filter_with_lineage(client):
+        response = client.get("/api/v1/tasks?filter=FULL&lineage=true")
+        assert response.status_code == 200
+        assert response.json == {'tasks': [
+            {'id': 5, 'title': 'Bottom_task_1', 'parent_id': 4,
+             'status': 'FULL', 'lineage': 'Sub_task_2 >> Main_task_2'}]}
+
     @staticmethod
     def test_post_success(client):
         data = {'title': 'Updated Title'}
@@ -70,6 +82,138 @@ class Testrouting:
         assert response.status_code == 200
 
 
+class TestConditionalGet:
+    @staticmethod
+    def test_etag_set(client):
+        response = client.get('/api/v1/tasks?id=1')
+        assert response.headers['ETag']
+        assert 'no-cache' in response.headers['Cache-Control']
+
+    @staticmethod
+    def test_not_modified(client, monkeypatch):
+        etag = client.get('/api/v1/tasks?id=1').headers['ETag']
+
+        def fail():
+            raise AssertionError('database should not be used')
+        monkeypatch.setattr('app.src.api.get_db', fail)
+        response = client.get('/api/v1/tasks?id=1',
+                              headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+
+    @staticmethod
+    def test_modified_after_write(client):
+        etag = client.get('/api/v1/tasks?id=1').headers['ETag']
+        client.post('/api/v1/tasks', json={'title': 'New task'})
+        response = client.get('/api/v1/tasks?id=1',
+                              headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+
+    @staticmethod
+    def test_modified_by_other_connection(app, client):
+        # the multi worker setting (TASK_CACHE_SIZE = 0)
+        app.extensions['task_cache'].max_entries = 0
+        url = '/api/v1/tasks?id=1&mode=single'
+        etag = client.get(url).headers['ETag']
+        # i.e. another worker process or the flask db commands
+        conn = sqlite3.connect(app.config['DATABASE'])
+        conn.execute("UPDATE task SET title = 'Elsewhere' WHERE id = 1")
+        conn.commit()
+        conn.close()
+        response = client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.json['tasks'][0]['title'] == 'Elsewhere'
+
+    @staticmethod
+    def test_no_etag_on_error(client):
+        response = client.get('/api/v1/tasks?id=1&mode=bad')
+        assert 'ETag' not in response.headers
+
+    @staticmethod
+    def test_html_view(client):
+        etag = client.get('/').headers['ETag']
+        response = client.get('/filter?mode=ongoing',
+                              headers={'If-None-Match': etag})
+        assert response.status_code == 304
+
+
+class TestPagination:
+    @staticmethod
+    def test_all_pages(app_context):
+        result, _ = api.get_task(None, 'all', limit=2)
+        assert [task['id'] for task in result['tasks']] == [1, 2]
+        assert result['next_after_id'] == 2
+        result, _ = api.get_task(None, 'all', after_id=4, limit=2)
+        assert [task['id'] for task in result['tasks']] == [5]
+        assert result['next_after_id'] is None
+
+    @staticmethod
+    def test_filter_pages(app_context):
+        result, _ = api.filter_task('EMPTY', after_id=1, limit=1)
+        assert [task['id'] for task in result['tasks']] == [2]
+        assert result['next_after_id'] == 2
+
+    @staticmethod
+    def test_route(client):
+        response = client.get('/api/v1/tasks?mode=all&after_id=3&limit=10')
+        assert response.status_code == 200
+        assert [task['id'] for task in response.json['tasks']] == [4, 5]
+        assert response.json['next_after_id'] is None
+
+    @staticmethod
+    def test_bad_limit(client):
+        response = client.get('/api/v1/tasks?mode=all&limit=0')
+        assert response.status_code == 400
+
+
+class TestStreaming:
+    @staticmethod
+    def test_ndjson_all(client):
+        response = client.get('/api/v1/tasks?mode=all&format=ndjson')
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        lines = [json.loads(line) for line in
+                 response.get_data(as_text=True).splitlines()]
+        assert [task['id'] for task in lines] == [1, 2, 3, 4, 5]
+        assert lines[4]['Level'] == 3
+
+    @staticmethod
+    def test_ndjson_filter_accept_header(client):
+        response = client.get('/api/v1/tasks?filter=empty&limit=2',
+                              headers={'Accept': 'application/x-ndjson'})
+        lines = response.get_data(as_text=True).splitlines()
+        assert [json.loads(line)['id'] for line in lines] == [1, 2]
+
+    @staticmethod
+    def test_ndjson_tree_not_supported(client):
+        response = client.get('/api/v1/tasks?id=1&format=ndjson')
+        assert response.status_code == 400
+
+    @staticmethod
+    @pytest.mark.parametrize('headers, query', [
+        ({}, '&format=ndjson'),
+        ({'Accept': 'application/x-ndjson'}, '')])
+    def test_ndjson_nested_not_supported(client, headers, query):
+        response = client.get(f'/api/v1/tasks?mode=nested{query}',
+                              headers=headers)
+        assert response.status_code == 400
+        assert response.json == {
+            'error': 'Only mode all and filter can be streamed.'}
+
+    @staticmethod
+    @pytest.mark.parametrize('headers, query', [
+        ({}, '&format=ndjson'),
+        ({'Accept': 'application/x-ndjson'}, '')])
+    def test_ndjson_children_not_supported(client, headers, query):
+        for url in ('/api/v1/tasks?mode=children',
+                    '/api/v1/tasks?id=2&mode=children'):
+            response = client.get(url + query, headers=headers)
+            assert response.status_code == 400
+            assert response.json == {
+                'error': 'Only mode all and filter can be streamed.'}
+
+
 class TestGetTasks:
     @staticmethod
     def test_get_task_tree(app_context):
@@ -112,6 +256,68 @@ class TestGetTasks:
         assert status == 200
         assert result == expected
 
+    @staticmethod
+    def test_get_children(app_context):
+        result, status = api.get_task(2, 'children')
+        expected = {'tasks':
+                    [{'id': 4, 'title': 'Sub_task_2', 'parent_id': 2,
+                      'status': 'EMPTY', 'child_count': 1,
+                      'empty_children': 0, 'half_children': 0,
+                      'full_children': 1}]}
+        assert status == 200
+        assert result == expected
+
+    @staticmethod
+    def test_get_root_children(app_context):
+        result, _ = api.get_task(None, 'children')
+        assert [task['id'] for task in result['tasks']] == [1, 2]
+        assert [task['child_count'] for task in result['tasks']] == [1, 1]
+
+    @staticmethod
+    def test_tree_max_depth(app_context):
+        result, _ = api.get_task(2, 'tree', max_depth=2)
+        assert [task['id'] for task in result['tasks']] == [2, 4]
+
+    @staticmethod
+    def test_all_max_depth(app_context):
+        result, _ = api.get_task(None, 'all', max_depth=1)
+        assert [task['id'] for task in result['tasks']] == [1, 2]
+
+    @staticmethod
+    def test_children_route(client):
+        response = client.get('/api/v1/tasks?mode=children')
+        assert [task['id'] for task in response.json['tasks']] == [1, 2]
+        response = client.get('/api/v1/tasks?id=1&mode=tree&max_depth=1')
+        assert [task['id'] for task in response.json['tasks']] == [1]
+
+    @staticmethod
+    def test_bad_max_depth(client):
+        response = client.get('/api/v1/tasks?id=1&max_depth=0')
+        assert response.status_code == 400
+
+    @staticmethod
+    def test_get_nested(app_context):
+        result, status = api.get_task(2, 'nested')
+        expected = {'tasks':
+                    [{'Level': 1, 'id': 2, 'title': 'Main_task_2',
+                      'parent_id': None, 'status': 'EMPTY',
+                      'sub_tasks': [
+                          {'Level': 2, 'id': 4, 'title': 'Sub_task_2',
+                           'parent_id': 2, 'status': 'EMPTY',
+                           'sub_tasks': [
+                               {'Level': 3, 'id': 5,
+                                'title': 'Bottom_task_1',
+                                'parent_id': 4, 'status': 'FULL'}]}]}]}
+        assert status == 200
+        assert result == expected
+
+    @staticmethod
+    def test_nested_route(client):
+        response = client.get('/api/v1/tasks?mode=nested')
+        trees = response.json['tasks']
+        assert [tree['id'] for tree in trees] == [1, 2]
+        assert trees[0]['sub_tasks'][0]['id'] == 3
+
     @staticmethod
     def test_get_task_bad_mode(app_context):
         result, status = api.get_task(1, 'bad_type')
@@ -162,6 +368,111 @@ class TestFilterTasks:
         assert result == expected
 
 
+class TestBatchReads:
+    @staticmethod
+    def test_multiple_statuses(app_context):
+        result, _ = api.filter_task('half,full')
+        assert [task['id'] for task in result['tasks']] == [3, 5]
+
+    @staticmethod
+    def test_get_tasks(app_context):
+        result, status = api.get_tasks([5, 1, 100])
+        assert status == 200
+        assert [task['id'] for task in result['tasks']] == [1, 5]
+
+    @staticmethod
+    def test_get_many_tasks(app_context):
+        result, _ = api.get_tasks(list(range(1, 50000)))
+        assert len(result['tasks']) == 5
+
+    @staticmethod
+    def test_filter_route(client):
+        response = client.get('/api/v1/tasks?filter=half,empty')
+        ids = [task['id'] for task in response.json['tasks']]
+        assert ids == [1, 2, 3, 4]
+
+    @staticmethod
+    def test_ids_route(client):
+        response = client.get('/api/v1/tasks?ids=5,3&lineage=true')
+        assert response.json == {'tasks': [
+            {'id': 3, 'title': 'Sub_task_1', 'parent_id': 1,
+             'status': 'HALF', 'lineage': 'Main_task_1'},
+            {'id': 5, 'title': 'Bottom_task_1', 'parent_id': 4,
+             'status': 'FULL', 'lineage': 'Sub_task_2 >> Main_task_2'}]}
+
+    @staticmethod
+    def test_bad_ids(client):
+        response = client.get('/api/v1/tasks?ids=1,a')
+        assert response.status_code == 400
+
+
+class TestGetStats:
+    @staticmethod
+    def test_all(app_context):
+        result, status = api.get_stats()
+        assert status == 200
+        assert result['stats'] == [
+            {'id': 1, 'total': 2, 'empty': 1, 'half': 1, 'full': 0},
+            {'id': 2, 'total': 3, 'empty': 2, 'half': 0, 'full': 1},
+            {'id': 3, 'total': 1, 'empty': 0, 'half': 1, 'full': 0},
+            {'id': 4, 'total': 2, 'empty': 1, 'half': 0, 'full': 1},
+            {'id': 5, 'total': 1, 'empty': 0, 'half': 0, 'full': 1}]
+
+    @staticmethod
+    def test_subtree(app_context):
+        result, _ = api.get_stats(4)
+        assert [row['id'] for row in result['stats']] == [4, 5]
+
+    @staticmethod
+    def test_route(client):
+        response = client.get('/api/v1/tasks/stats?id=2')
+        assert response.status_code == 200
+        assert response.json['stats'][0] == {'id': 2, 'total': 3, 'empty': 2,
+                                             'half': 0, 'full': 1}
+
+
+class TestSearchTasks:
+    @staticmethod
+    def test_match(app_context):
+        result, status = api.search_tasks('bottom')
+        assert status == 200
+        assert result == {'tasks': [
+            {'id': 5, 'title': 'Bottom_task_1', 'parent_id': 4,
+             'status': 'FULL', 'lineage': 'Sub_task_2 >> Main_task_2'}]}
+
+    @staticmethod
+    def test_prefix_and_words(app_context):
+        result, _ = api.search_tasks('mai 2')
+        assert [task['id'] for task in result['tasks']] == [2]
+
+    @staticmethod
+    def test_index_follows_writes(app_context):
+        api.patch_task(3, {'title': 'Sand the legs'})
+        api.post_task({'title': 'Oil the legs'})
+        api.delete_task(5)
+        result, _ = api.search_tasks('legs')
+        assert sorted(task['id'] for task in result['tasks']) == [3, 6]
+        assert api.search_tasks('sub_task_1')[0] == {'tasks': []}
+        assert api.search_tasks('bottom')[0] == {'tasks': []}
+
+    @staticmethod
+    def test_query_syntax_escaped(app_context):
+        result, status = api.search_tasks('"main" OR NEAR(')
+        assert status == 200
+
+    @staticmethod
+    def test_empty_query(app_context):
+        result, status = api.search_tasks(' * ')
+        assert status == 400
+        assert result == {'error': 'Missing search query.'}
+
+    @staticmethod
+    def test_route(client):
+        response = client.get('/api/v1/tasks/search?q=sub&limit=1')
+        assert response.status_code == 200
+        assert len(response.json['tasks']) == 1
+
+
 class TestPostTask:
     @staticmethod
     def test_success(app_context):
@@ -198,6 +509,120 @@ class TestPostTask:
         assert result == {'error': 'Bad parent id.'}
 
 
+class TestPostTasks:
+    @staticmethod
+    def titles(tasks):
+        return [(task['id'], task['title'], task['parent_id'])
+                for task in tasks]
+
+    def test_flat(self, app_context):
+        tasks = [{'id': 'a', 'title': 'Project', 'parent_id': 1},
+                 {'id': 'b', 'title': 'Step 2', 'parent_ref': 'c'},
+                 {'id': 'c', 'title': 'Step 1', 'parent_ref': 'a'}]
+        result, status = api.post_tasks(tasks)
+        assert status == 200
+        assert result == {'ids': {'a': 6, 'c': 7, 'b': 8}}
+        data, _ = api.get_task(6, 'tree')
+        assert self.titles(data['tasks']) == [(6, 'Project', 1),
+                                              (7, 'Step 1', 6),
+                                              (8, 'Step 2', 7)]
+
+    def test_nested(self, app_context):
+        tasks = [{'id': 1, 'title': 'Template', 'parent_id': None,
+                  'sub_tasks': [{'id': 2, 'title': 'Cut'},
+                                {'title': 'Glue',
+                                 'sub_tasks': [{'title': 'Clamp'}]}]}]
+        result, status = api.post_tasks(tasks)
+        assert status == 200
+        assert result == {'ids': {'1': 6, '2': 7}}
+        data, _ = api.get_task(6, 'tree')
+        assert self.titles(data['tasks']) == [(6, 'Template', None),
+                                              (7, 'Cut', 6),
+                                              (8, 'Glue', 6),
+                                              (9, 'Clamp', 8)]
+        assert api.show_lineage(9)[0] == {'lineage': 'Glue >> Template'}
+
+    def test_ids_compared_as_strings(self, app_context):
+        # parent_ref '1' is the temporary task 1, not existing task 1
+        result, status = api.post_tasks(
+            [{'id': 1, 'title': 'A'},
+             {'id': 2, 'title': 'B', 'parent_ref': '1'}])
+        assert result == {'ids': {'1': 6, '2': 7}}
+        assert api.get_task(7, 'single')[0]['tasks'][0]['parent_id'] == 6
+
+    def test_existing_parent_not_shadowed(self, app_context):
+        # parent_id 3 is the existing task 3, not the temporary task 3
+        result, status = api.post_tasks(
+            [{'id': 'x', 'title': 'X', 'parent_id': 3},
+             {'id': 3, 'title': 'Three'}])
+        assert status == 200
+        assert api.get_task(result['ids']['x'], 'single')[0][
+            'tasks'][0]['parent_id'] == 3
+
+    def test_duplicate_after_normalizing(self, app_context):
+        result, status = api.post_tasks([{'id': 1, 'title': 'A'},
+                                         {'id': '1', 'title': 'B'}])
+        assert status == 400
+        assert result == {'error': 'Duplicate id 1.'}
+
+    @pytest.mark.parametrize('task, error', [
+        ({'title': 'A', 'parent_id': 1, 'parent_ref': 'b'},
+         'Use either parent_id or parent_ref.'),
+        ({'title': 'A', 'sub_tasks': [{'title': 'B', 'parent_id': 1}]},
+         'Sub tasks cannot have a parent_id or parent_ref.')])
+    def test_ambiguous_parent(self, app_context, task, error):
+        result, status = api.post_tasks([task])
+        assert status == 400
+        assert result == {'error': error}
+
+    def test_missing_title(self, app_context):
+        result, status = api.post_tasks([{'id': 1}])
+        assert status == 400
+        assert result == {'error': 'Missing title.'}
+
+    def test_cycle(self, app_context):
+        tasks = [{'id': 'a', 'title': 'A', 'parent_ref': 'b'},
+                 {'id': 'b', 'title': 'B', 'parent_ref': 'a'}]
+        result, status = api.post_tasks(tasks)
+        assert status == 400
+        assert result == {'error': 'Tasks cannot be their own parent '
+                          'or form a cycle.'}
+
+    @pytest.mark.parametrize('task, error', [
+        ({'title': ['x']}, 'Title has to be a string.'),
+        ({'title': 'x', 'status': {'a': 1}}, 'Status has to be a string.'),
+        ({'title': 'x', 'parent_id': [1]}, 'Bad parent id.')])
+    def test_bad_types(self, app_context, task, error):
+        result, status = api.post_tasks([task])
+        assert status == 400
+        assert result == {'error': error}
+
+    def test_bad_parent_rolls_back(self, app_context):
+        tasks = [{'id': 'a', 'title': 'A'},
+                 {'id': 'b', 'title': 'B', 'parent_id': 100}]
+        result, status = api.post_tasks(tasks)
+        assert status == 400
+        assert result == {'error': 'Bad parent id or status.'}
+        assert len(api.get_task(None, 'all')[0]['tasks']) == 5
+
+    def test_ids_not_reused(self, app_context):
+        api.delete_task(5)
+        result, _ = api.post_tasks([{'id': 'a', 'title': 'A'}])
+        assert result == {'ids': {'a': 6}}
+
+    @staticmethod
+    def test_route(client):
+        response = client.post('/api/v1/tasks/bulk',
+                               json={'tasks': [{'id': 1, 'title': 'A'}]})
+        assert response.status_code == 200
+        assert response.json == {'ids': {'1': 6}}
+
+    @staticmethod
+    def test_route_bad_data(client):
+        response = client.post('/api/v1/tasks/bulk', json={'tasks': 1})
+        assert response.status_code == 400
+
+
 class TestPatchTask:
     @staticmethod
     def test_success(app_context):
@@ -231,6 +656,37 @@ class TestPatchTask:
         assert status == 400
         assert result == {'error': 'Bad data.'}
 
+    @staticmethod
+    def test_self_parent(app_context):
+        result, status = api.patch_task(1, {'parent_id': 1})
+        assert status == 400
+        assert result == {'error': 'Parent task cannot be the task itself '
+                          'or one of its sub tasks.'}
+
+    @staticmethod
+    def test_cycle(app_context):
+        result, status = api.patch_task('2', {'parent_id': '5'})
+        assert status == 400
+        assert result == {'error': 'Parent task cannot be the task itself '
+                          'or one of its sub tasks.'}
+        assert api.get_task(5, 'single')[0]['tasks'][0]['parent_id'] == 4
+
+    @staticmethod
+    def test_cycle_checked_in_transaction(app_context, monkeypatch):
+        # the check passed before another request moved the tasks
+        monkeypatch.setattr(api, 'is_descendant', lambda *args: False)
+        result, status = api.patch_task(2, {'parent_id': '5'})
+        assert status == 400
+        assert result == {'error': 'Parent task cannot be the task itself '
+                          'or one of its sub tasks.'}
+        assert api.get_task(2, 'single')[0]['tasks'][0]['parent_id'] is None
+
+    @staticmethod
+    def test_move_to_other_tree(app_context):
+        result, status = api.patch_task(2, {'parent_id': 3})
+        assert status == 200
+        assert result['tasks'][0]['parent_id'] == 3
+
     @staticmethod
     def test_all_bad_fields(app_context):
         patch_data = {'id': '100', 'hack': True}
@@ -239,6 +695,61 @@ class TestPatchTask:
         assert result == {'error': 'All bad fields.'}
 
 
+class TestPatchStatus:
+    @staticmethod
+    def statuses():
+        data, _ = api.get_task(None, 'all')
+        return {task['id']: task['status'] for task in data['tasks']}
+
+    def test_ids(self, app_context):
+        result, status = api.patch_status('full', ids=[1, 3])
+        assert status == 200
+        assert result == {'updated': 2}
+        assert self.statuses() == {1: 'FULL', 2: 'EMPTY', 3: 'FULL',
+                                   4: 'EMPTY', 5: 'FULL'}
+
+    def test_root(self, app_context):
+        result, status = api.patch_status('HALF', root=2)
+        assert status == 200
+        assert result == {'updated': 3}
+        assert self.statuses() == {1: 'EMPTY', 2: 'HALF', 3: 'HALF',
+                                   4: 'HALF', 5: 'HALF'}
+
+    @staticmethod
+    def test_bad_status(app_context):
+        result, status = api.patch_status('TRASH', ids=[1])
+        assert status == 400
+        assert result == {'error': 'Bad status.'}
+
+    @staticmethod
+    def test_missing_target(app_context):
+        result, status = api.patch_status('FULL')
+        assert status == 400
+        assert result == {'error': 'Missing ids or root.'}
+
+    @pytest.mark.parametrize('target', [
+        {'ids': ['a']}, {'ids': [1.9]}, {'ids': [True]}, {'ids': [[1]]},
+        {'ids': ['1.0']}, {'root': 1.9}, {'root': True}, {'root': '-1'}])
+    def test_bad_ids(self, app_context, target):
+        result, status = api.patch_status('FULL', **target)
+        assert status == 400
+        assert result == {'error': 'Ids have to be integers.'}
+        assert self.statuses()[1] == 'EMPTY'
+
+    def test_digit_strings(self, app_context):
+        result, status = api.patch_status('FULL', ids=['1'])
+        assert result == {'updated': 1}
+        result, status = api.patch_status('FULL', root='4')
+        assert result == {'updated': 2}
+
+    @staticmethod
+    def test_route(client):
+        response = client.patch('/api/v1/tasks/status',
+                                json={'status': 'FULL', 'root': 1})
+        assert response.status_code == 200
+        assert response.json == {'updated': 2}
+
+
 class TestDeleteTask:
 
     @staticmethod
@@ -263,6 +774,116 @@ class TestDeleteTask:
         assert status == 400
 
 
+class TestCascadeDelete:
+    @staticmethod
+    def test_subtree(app_context):
+        result, status = api.delete_task(2, cascade=True)
+        assert status == 200
+        assert result == {'deleted': 3}
+        data, _ = api.get_task(None, 'all')
+        assert [task['id'] for task in data['tasks']] == [1, 3]
+
+    @staticmethod
+    def test_leaf(app_context):
+        result, status = api.delete_task(3, cascade=True)
+        assert result == {'deleted': 1}
+
+    @staticmethod
+    def test_non_exist(app_context):
+        result, status = api.delete_task(100, cascade=True)
+        assert status == 200
+        assert result == {'deleted': 0}
+
+    @staticmethod
+    def test_closure_cleared(app_context):
+        from app.src.db import get_db
+        api.delete_task(2, cascade=True)
+        rows = get_db().execute('SELECT ancestor, descendant '
+                                'FROM task_closure '
+                                'ORDER BY ancestor, descendant').fetchall()
+        assert [tuple(row) for row in rows] == [(1, 1), (1, 3), (3, 3)]
+
+    @staticmethod
+    def test_route(client):
+        response = client.delete('/api/v1/tasks?id=1&cascade=true')
+        assert response.status_code == 200
+        assert response.json == {'deleted': 2}
+
+
+class TestStatusRollup:
+    @staticmethod
+    def tasks():
+        from app.src.db import get_db
+        data = get_db().execute(
+            'SELECT id, status, empty_children, half_children, '
+            'full_children FROM task ORDER BY id').fetchall()
+        return {row[0]: tuple(row)[1:] for row in data}
+
+    def test_initial_counters(self, app_context):
+        assert self.tasks() == {1: ('EMPTY', 0, 1, 0),
+                                2: ('EMPTY', 1, 0, 0),
+                                3: ('HALF', 0, 0, 0),
+                                4: ('EMPTY', 0, 0, 1),
+                                5: ('FULL', 0, 0, 0)}
+
+    def test_propagates_up(self, app_context):
+        api.patch_task(5, {'status': 'HALF'})
+        tasks = self.tasks()
+        assert tasks[4] == ('HALF', 0, 1, 0)
+        assert tasks[2] == ('HALF', 0, 1, 0)
+
+    def test_stops_when_unchanged(self, app_context):
+        api.patch_task(4, {'status': 'HALF'})
+        api.post_task({'title': 'New', 'parent_id': 4})
+        # 4 has a FULL and an EMPTY child, it stays HALF
+        tasks = self.tasks()
+        assert tasks[4] == ('HALF', 1, 0, 1)
+        assert tasks[2] == ('HALF', 0, 1, 0)
+
+    def test_reparent(self, app_context):
+        api.patch_task(5, {'parent_id': 3})
+        tasks = self.tasks()
+        assert tasks[3] == ('FULL', 0, 0, 1)
+        assert tasks[1] == ('FULL', 0, 0, 1)
+        assert tasks[4][1:] == (0, 0, 0)
+
+    def test_delete(self, app_context):
+        api.patch_task(4, {'status': 'FULL'})
+        assert self.tasks()[2] == ('FULL', 0, 0, 1)
+        api.post_task({'title': 'New', 'parent_id': 2})
+        assert self.tasks()[2] == ('HALF', 1, 0, 1)
+        api.delete_task(6)
+        assert self.tasks()[2] == ('FULL', 0, 0, 1)
+
+    def test_bulk_status(self, app_context):
+        api.patch_status('FULL', ids=[3])
+        assert self.tasks()[1] == ('FULL', 0, 0, 1)
+
+    def test_disabled(self, app, app_context):
+        app.config['STATUS_ROLLUP'] = False
+        api.patch_task(3, {'status': 'FULL'})
+        assert self.tasks()[1] == ('EMPTY', 0, 0, 1)
+
+    def test_post_tasks(self, app_context):
+        api.post_tasks([{'title': 'P', 'status': 'EMPTY', 'sub_tasks': [
+            {'title': 'c', 'status': 'FULL'},
+            {'title': 'd', 'status': 'FULL',
+             'sub_tasks': [{'title': 'e', 'status': 'FULL'}]}]}])
+        tasks = self.tasks()
+        assert tasks[6] == ('FULL', 0, 0, 2)
+        assert tasks[8] == ('FULL', 0, 0, 1)
+
+    def test_post_tasks_under_existing(self, app_context):
+        api.post_tasks([{'title': 'P', 'parent_id': 5, 'sub_tasks': [
+            {'title': 'c', 'status': 'FULL'},
+            {'title': 'd'}]}])
+        tasks = self.tasks()
+        assert tasks[6] == ('HALF', 1, 0, 1)
+        assert tasks[5] == ('HALF', 0, 1, 0)
+        assert tasks[4] == ('HALF', 0, 1, 0)
+        assert tasks[2] == ('HALF', 0, 1, 0)
+
+
 class TestShowLineage:
     @staticmethod
     def test_no_parent_id(app_context):
@@ -279,6 +900,30 @@ class TestShowLineage:
         assert status == 200
 
 
+class TestShowLineages:
+    @staticmethod
+    def test_multiple_ids(app_context):
+        result, status = api.show_lineages([1, 3, 5])
+        expected = {'lineages': {1: '',
+                                 3: 'Main_task_1',
+                                 5: 'Sub_task_2 >> Main_task_2'}}
+        assert result == expected
+        assert status == 200
+
+    @staticmethod
+    def test_missing_id(app_context):
+        result, status = api.show_lineages([100])
+        assert result == {'lineages': {}}
+        assert status == 200
+
+    @staticmethod
+    def test_add_lineage(app_context):
+        tasks = [{'id': 4}, {'id': 2}]
+        api.add_lineage(tasks)
+        assert tasks == [{'id': 4, 'lineage': 'Main_task_2'},
+                         {'id': 2, 'lineage': ''}]
+
+
 class TestGetAvailable:
     @staticmethod
     def test_bottom_task(app_context):
@@ -290,6 +935,253 @@ class TestGetAvailable:
         assert result == expected
 
 
+class TestExport:
+    @staticmethod
+    def test_csv(client):
+        response = client.get('/api/v1/export')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/csv'
+        assert 'attachment' in response.headers['Content-Disposition']
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert [row['id'] for row in rows] == ['1', '3', '2', '4', '5']
+        assert rows[4]['depth'] == '2'
+        assert rows[4]['lineage'] == 'Main_task_2 >> Sub_task_2'
+        assert rows[4]['parent_id'] == '4'
+
+    @staticmethod
+    def test_json_root(client):
+        response = client.get('/api/v1/export?format=json&root=4')
+        assert response.mimetype == 'application/json'
+        assert [(task['id'], task['parent_id'], task['depth'],
+                 task['lineage']) for task in response.json] == [
+            (4, None, 0, ''), (5, 4, 1, 'Sub_task_2')]
+
+    @staticmethod
+    def test_parents_first(app_context):
+        from app.src.db import get_db
+        seen = set()
+        for row in get_db().execute(*api.export_query()):
+            assert row['parent_id'] is None or row['parent_id'] in seen
+            seen.add(row['id'])
+        assert len(seen) == 5
+
+    @staticmethod
+    def test_empty(app_context):
+        sql, params = api.export_query()
+        sql = sql.replace('parent_id IS NULL', '0')
+        assert ''.join(api.iter_json(sql, params)) == '[]\n'
+        assert ''.join(api.iter_csv(sql, params)).startswith('id,parent_id')
+
+    @staticmethod
+    def test_bad_request(client):
+        assert client.get('/api/v1/export?format=pdf').status_code == 400
+        assert client.get('/api/v1/export?root=100').status_code == 400
+
+
+class TestImportTasks:
+    @staticmethod
+    def test_round_trip(client):
+        data = client.get('/api/v1/export?root=2').data
+        response = client.post('/api/v1/import?parent=1', data=data,
+                               content_type='text/csv')
+        assert response.status_code == 200
+        assert response.json == {'imported': 3}
+        tasks = client.get('/api/v1/tasks?id=1').json['tasks']
+        assert [(task['id'], task['parent_id'], task['title'])
+                for task in tasks] == [
+            (1, None, 'Main_task_1'), (3, 1, 'Sub_task_1'),
+            (6, 1, 'Main_task_2'), (7, 6, 'Sub_task_2'),
+            (8, 7, 'Bottom_task_1')]
+
+    @staticmethod
+    def test_file_upload(client):
+        data = {'file': (io.BytesIO(b'[{"id": 9, "title": "new"}]'),
+                         'tasks.json')}
+        response = client.post('/api/v1/import', data=data)
+        assert response.json == {'imported': 1}
+
+    @staticmethod
+    def test_orphan(app_context):
+        result, status = api.import_tasks(
+            [{'id': 1, 'title': 'a'}, {'id': 2, 'parent_id': 5,
+                                       'title': 'b'}])
+        assert status == 400
+        assert result == {'error': 'Unknown parent id 5.'}
+
+    @staticmethod
+    def test_cycle(app_context):
+        result, status = api.import_tasks(
+            [{'id': 1, 'parent_id': 2, 'title': 'a'},
+             {'id': 2, 'parent_id': 1, 'title': 'b'}])
+        assert status == 400
+        assert api.get_task(None, 'all')[0]['tasks'][-1]['id'] == 5
+
+    @staticmethod
+    @pytest.mark.parametrize('task, error', [
+        ({'id': 1, 'title': 'a', 'created': {'a': 1}},
+         'Created has to be a string.'),
+        ({'id': 1, 'title': 'a', 'completed_date': [1]},
+         'Completed_date has to be a string.'),
+        ({'id': [1], 'title': 'a'}, 'Bad task id.'),
+        ({'id': 1, 'parent_id': {'id': 2}, 'title': 'a'}, 'Bad parent id.')])
+    def test_bad_types(client, task, error):
+        response = client.post('/api/v1/import?format=json',
+                               json=[task])
+        assert response.status_code == 400
+        assert response.json == {'error': error}
+
+    @staticmethod
+    def test_bulk_bad_types_rolled_back(app_context, monkeypatch):
+        monkeypatch.setattr(api, 'BULK_INSERT_MIN_ROWS', 1)
+        result, status = api.import_tasks(
+            [{'id': 1, 'title': 'a'},
+             {'id': 2, 'title': 'b', 'created': {'a': 1}}])
+        assert status == 400
+        assert len(api.get_task(None, 'all')[0]['tasks']) == 5
+        # the insert triggers are still there
+        api.post_task({'title': 'after', 'parent_id': 5})
+        assert api.show_lineage(6)[0]['lineage'] == \
+            'Bottom_task_1 >> Sub_task_2 >> Main_task_2'
+
+    @staticmethod
+    def test_bad_file(client):
+        response = client.post('/api/v1/import?format=json', data=b'{')
+        assert response.status_code == 400
+
+    @staticmethod
+    def test_bulk_matches_triggers(app_context, monkeypatch):
+        from app.src.db import get_db
+        tasks = [{'id': 'a', 'title': 'a', 'status': 'FULL'},
+                 {'id': 'b', 'parent_id': 'a', 'title': 'b',
+                  'status': 'FULL'},
+                 {'id': 'c', 'parent_id': 'b', 'title': 'bottom c',
+                  'status': 'FULL'}]
+        api.import_tasks(tasks, parent_id=4)
+        monkeypatch.setattr(api, 'BULK_INSERT_MIN_ROWS', 1)
+        api.import_tasks(tasks, parent_id=4)
+        db = get_db()
+
+        def closure(ids):
+            data = db.execute(
+                '''SELECT d.title, a.title, c.depth FROM task_closure c
+                INNER JOIN task a ON a.id = c.ancestor
+                INNER JOIN task d ON d.id = c.descendant
+                WHERE c.descendant IN (SELECT value FROM json_each(?))
+                ORDER BY c.descendant, c.depth''', (json.dumps(ids),))
+            return [tuple(row) for row in data]
+        assert closure([9, 10, 11]) == closure([6, 7, 8])
+        assert len(closure([9, 10, 11])) == 12
+        assert dict(db.execute(
+            '''SELECT empty_children, half_children, full_children, status
+            FROM task WHERE id = 4''').fetchone()) == {
+            'empty_children': 0, 'half_children': 0, 'full_children': 3,
+            'status': 'FULL'}
+        assert [task['id'] for task in
+                api.search_tasks('bottom c')[0]['tasks']] == [8, 11]
+        # the insert triggers are back
+        api.post_task({'title': 'after', 'parent_id': 11})
+        assert api.show_lineage(12)[0]['lineage'] == \
+            'bottom c >> b >> a >> Sub_task_2 >> Main_task_2'
+
+    @staticmethod
+    def test_command(app, tmp_path):
+        path = tmp_path / 'tasks.csv'
+        path.write_text('id,parent_id,title\n1,,a\n2,1,b\n')
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['db', 'import', str(path),
+                                     '--parent', '3'])
+        assert 'Imported 2 tasks.' in result.output
+        path.write_text('id,parent_id,title\n1,2,a\n')
+        result = runner.invoke(args=['db', 'import', str(path)])
+        assert result.exit_code != 0
+        assert 'Unknown parent id 2.' in result.output
+
+
+class TestSearchParents:
+    @staticmethod
+    def test_prefix(app_context):
+        result, status = api.search_parents('main')
+        assert status == 200
+        assert result == {'options': [{'id': 1, 'title': 'Main_task_1'},
+                                      {'id': 2, 'title': 'Main_task_2'}]}
+
+    @staticmethod
+    def test_excludes_subtree(app_context):
+        result, _ = api.search_parents('', id=2)
+        assert [task['id'] for task in result['options']] == [1, 3]
+
+    @staticmethod
+    def test_wildcards_escaped(app_context):
+        assert api.search_parents('%')[0] == {'options': []}
+        assert api.search_parents('Main_')[0]['options'] != []
+        assert api.search_parents('Main%')[0] == {'options': []}
+
+    @staticmethod
+    def test_limit(app_context):
+        result, _ = api.search_parents('', limit=2)
+        assert len(result['options']) == 2
+        assert api.search_parents('', limit=0)[1] == 400
+
+    @staticmethod
+    def test_uses_index(app_context):
+        from app.src.db import get_db
+        plan = get_db().execute(
+            '''EXPLAIN QUERY PLAN SELECT id, title FROM task
+               WHERE title LIKE ? ESCAPE '\\'
+               ORDER BY title COLLATE NOCASE LIMIT 10''',
+            ('main%',)).fetchall()
+        assert any('idx_task_title' in row['detail'] for row in plan)
+
+    @staticmethod
+    def test_route(client):
+        response = client.get('/api/v1/tasks/parents?q=sub&id=3')
+        assert response.status_code == 200
+        assert response.json == {'options': [{'id': 4,
+                                              'title': 'Sub_task_2'}]}
+
+
+class TestTaskClosure:
+    @staticmethod
+    def closure():
+        from app.src.db import get_db
+        data = get_db().execute(
+            'SELECT ancestor, descendant, depth FROM task_closure '
+            'ORDER BY ancestor, descendant').fetchall()
+        return [tuple(row) for row in data]
+
+    def test_initial(self, app_context):
+        assert self.closure() == [(1, 1, 0), (1, 3, 1), (2, 2, 0),
+                                  (2, 4, 1), (2, 5, 2), (3, 3, 0),
+                                  (4, 4, 0), (4, 5, 1), (5, 5, 0)]
+
+    def test_post(self, app_context):
+        api.post_task({'title': 'Test Post', 'parent_id': 5})
+        assert {(2, 6, 3), (4, 6, 2), (5, 6, 1),
+                (6, 6, 0)} <= set(self.closure())
+
+    def test_reparent(self, app_context):
+        api.patch_task(4, {'parent_id': 3})
+        assert self.closure() == [(1, 1, 0), (1, 3, 1), (1, 4, 2),
+                                  (1, 5, 3), (2, 2, 0), (3, 3, 0),
+                                  (3, 4, 1), (3, 5, 2), (4, 4, 0),
+                                  (4, 5, 1), (5, 5, 0)]
+
+    def test_reparent_to_root(self, app_context):
+        api.patch_task(4, {'parent_id': None})
+        assert (2, 4, 1) not in self.closure()
+        assert (2, 5, 2) not in self.closure()
+        assert api.get_task(4, 'tree')[0]['tasks'][1]['Level'] == 2
+
+    def test_delete(self, app_context):
+        api.delete_task(5)
+        assert all(5 not in row[:2] for row in self.closure())
+
+    def test_failed_delete(self, app_context):
+        before = self.closure()
+        api.delete_task(1)
+        assert self.closure() == before
+
+
 class MockRow:
     def __init__(self, **kwargs):
         self._data = kwargs
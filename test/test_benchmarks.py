@@ -0,0 +1,57 @@
+from benchmarks.forest import generate_forest, load_forest, SHAPES
+from benchmarks import load
+from app.src.db import get_db
+import pytest
+
+
+class TestGenerateForest:
+    @staticmethod
+    @pytest.mark.parametrize('shape', list(SHAPES))
+    def test_shape(shape):
+        rows = generate_forest(2000, shape)
+        depth = {}
+        for row in rows:
+            # parents are generated before their sub tasks
+            depth[row['ref']] = 0 if row['parent_ref'] is None \
+                else depth[row['parent_ref']] + 1
+        assert len(rows) == 2000
+        assert max(depth.values()) <= SHAPES[shape]['max_depth']
+
+    @staticmethod
+    def test_reproducible():
+        assert generate_forest(100, seed=1) == generate_forest(100, seed=1)
+        assert generate_forest(100, seed=1) != generate_forest(100, seed=2)
+
+    @staticmethod
+    def test_load(app_context):
+        ids = load_forest(get_db(), generate_forest(1500, 'wide'))
+        count = get_db().execute('SELECT COUNT(*) FROM task').fetchone()[0]
+        assert len(ids) == 1500
+        assert count == 1505
+
+
+class TestLoad:
+    @staticmethod
+    def test_parse_mix():
+        assert load.parse_mix('get=3,index') == {'get': 3, 'index': 1}
+        with pytest.raises(Exception):
+            load.parse_mix('nope=1')
+
+    @staticmethod
+    def test_summarize():
+        results = [('get', 200, 0.01, False), ('get', 200, 0.03, False),
+                   ('toggle', 503, 0.02, True)]
+        summary = load.summarize(results, seconds=2)
+        assert summary['all']['requests'] == 3
+        assert summary['all']['per_sec'] == 1.5
+        assert summary['get']['p99_ms'] == 30
+        assert summary['toggle']['errors'] == 1
+        assert summary['toggle']['locked_rate'] == 1
+        assert load.summarize([], 1) == {'all': {'requests': 0}}
+
+    @staticmethod
+    def test_operations():
+        ops = load.operations(10)
+        assert set(ops) == set(load.MIX)
+        method, path, body = ops['insert']()
+        assert method == 'POST' and 1 <= body['parent_id'] <= 10
@@ -0,0 +1,126 @@
+from app.flask_app import cache
+import json
+import sqlite3
+
+
+class TestTaskCache:
+    @staticmethod
+    def test_hit_and_miss():
+        task_cache = cache.TaskCache()
+        calls = []
+        for _ in range(3):
+            value = task_cache.get_or_build('key', lambda: calls.append(1),
+                                            'v1')
+        assert value is None
+        assert len(calls) == 1
+        assert task_cache.stats()['hits'] == 2
+        assert task_cache.stats()['misses'] == 1
+
+    @staticmethod
+    def test_new_version():
+        task_cache = cache.TaskCache()
+        task_cache.get_or_build('key', lambda: 1, 'v1')
+        assert task_cache.get_or_build('key', lambda: 2, 'v2') == 2
+        assert task_cache.stats()['version'] == 'v2'
+        assert task_cache.stats()['entries'] == 1
+
+    @staticmethod
+    def test_invalidate():
+        task_cache = cache.TaskCache()
+        task_cache.get_or_build('key', lambda: 1, 'v1')
+        task_cache.invalidate()
+        assert task_cache.get_or_build('key', lambda: 2, 'v1') == 2
+
+    @staticmethod
+    def test_max_entries():
+        task_cache = cache.TaskCache(max_entries=2)
+        for key in ['a', 'b', 'a', 'c']:
+            task_cache.get_or_build(key, lambda: key, 'v1')
+        assert task_cache.stats()['entries'] == 2
+        # 'b' was the least recently used entry
+        assert task_cache.get_or_build('b', lambda: 'new', 'v1') == 'new'
+
+    @staticmethod
+    def test_max_bytes():
+        tasks = [{'id': i, 'title': f'task {i}'} for i in range(100)]
+        size = cache.approximate_size(tasks)
+        task_cache = cache.TaskCache(max_bytes=size * 2)
+        for key in ['a', 'b', 'c']:
+            task_cache.get_or_build(key, lambda: list(tasks), 'v1')
+        stats = task_cache.stats()
+        assert stats['entries'] == 2
+        assert stats['bytes'] <= stats['max_bytes']
+        # views larger than the whole cache are not stored
+        task_cache.get_or_build('big', lambda: tasks * 3, 'v1')
+        assert task_cache.stats()['entries'] == 2
+
+    @staticmethod
+    def test_disabled():
+        task_cache = cache.TaskCache(max_entries=0)
+        task_cache.get_or_build('key', lambda: 1, 'v1')
+        assert task_cache.get_or_build('key', lambda: 2, 'v1') == 2
+
+    @staticmethod
+    def test_write_during_build():
+        task_cache = cache.TaskCache()
+
+        def build():
+            task_cache.invalidate()
+            return 'outdated'
+        task_cache.get_or_build('key', build, 'v1')
+        assert task_cache.stats()['entries'] == 0
+
+
+class TestInvalidation:
+    @staticmethod
+    def test_get_served_from_cache(client):
+        client.get('/api/v1/tasks?id=1')
+        client.get('/api/v1/tasks?id=1')
+        stats = client.get('/api/v1/cache').json
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+
+    @staticmethod
+    def test_patch_invalidates(client):
+        client.get('/api/v1/tasks?id=1&mode=single')
+        client.patch('/api/v1/tasks?id=1',
+                     data=json.dumps({'title': 'Updated Title'}),
+                     headers={"Content-Type": "application/json"})
+        response = client.get('/api/v1/tasks?id=1&mode=single')
+        assert response.json['tasks'][0]['title'] == 'Updated Title'
+
+    @staticmethod
+    def test_post_invalidates(client):
+        client.get('/api/v1/tasks?filter=empty')
+        client.post('/api/v1/tasks', json={'title': 'New task'})
+        response = client.get('/api/v1/tasks?filter=empty')
+        assert len(response.json['tasks']) == 4
+
+    @staticmethod
+    def test_delete_invalidates(client):
+        client.get('/api/v1/tasks?id=4')
+        client.delete('/api/v1/tasks?id=5')
+        response = client.get('/api/v1/tasks?id=4')
+        assert [task['id'] for task in response.json['tasks']] == [4]
+
+    @staticmethod
+    def test_other_connection_invalidates(app, client):
+        client.get('/api/v1/tasks?id=1&mode=single')
+        # i.e. another worker process or flask db import
+        conn = sqlite3.connect(app.config['DATABASE'])
+        conn.execute("UPDATE task SET title = 'Elsewhere' WHERE id = 1")
+        conn.commit()
+        conn.close()
+        response = client.get('/api/v1/tasks?id=1&mode=single')
+        assert response.json['tasks'][0]['title'] == 'Elsewhere'
+
+    @staticmethod
+    def test_index_cached(client, monkeypatch):
+        calls = []
+        monkeypatch.setattr('app.src.todo.render_template',
+                            lambda file, tasks: file)
+        monkeypatch.setattr('app.src.todo.tasks_to_trees',
+                            lambda tasks: calls.append(1) or [])
+        client.get('/')
+        client.get('/')
+        assert len(calls) == 1
@@ -1,6 +1,7 @@
 from app.flask_app import db
 from flask import g
 from sqlite3 import Connection
+import sqlite3
 import pytest
 import os
 
@@ -43,4 +44,148 @@ class TestInitDb:
                               WHERE type='table' AND
                               name!='sqlite_sequence';''').fetchall()
         table_names = [item['name'] for item in result]
-        assert table_names == ['task']
+        assert table_names == ['schema_version', 'task', 'task_closure',
+                               'task_fts', 'task_fts_data', 'task_fts_idx',
+                               'task_fts_docsize', 'task_fts_config',
+                               'data_version']
+
+
+class TestUpgradeDb:
+    @staticmethod
+    def test_new_database(tmp_path):
+        applied = db.upgrade_db(tmp_path / 'app.sqlite')
+        assert applied == [path.name for _, _, path in db.list_migrations()]
+
+    @staticmethod
+    def test_nothing_pending(tmp_path):
+        db.upgrade_db(tmp_path / 'app.sqlite')
+        assert db.upgrade_db(tmp_path / 'app.sqlite') == []
+
+    @staticmethod
+    def test_keeps_data(tmp_path):
+        db.upgrade_db(tmp_path / 'app.sqlite', load_sample=True)
+        conn = sqlite3.connect(tmp_path / 'app.sqlite')
+        conn.execute("INSERT INTO task (title) VALUES ('keep me')")
+        conn.commit()
+        conn.close()
+        db.upgrade_db(tmp_path / 'app.sqlite', load_sample=True)
+        conn = sqlite3.connect(tmp_path / 'app.sqlite')
+        titles = [row[0] for row in conn.execute('SELECT title FROM task')]
+        conn.close()
+        assert titles.count('keep me') == 1
+        assert titles.count('Workshop Table') == 1
+
+    @staticmethod
+    def test_only_missing_applied(tmp_path):
+        conn = sqlite3.connect(tmp_path / 'app.sqlite')
+        conn.executescript(db.list_migrations()[0][2].read_text())
+        conn.execute("INSERT INTO task (title) VALUES ('legacy')")
+        conn.execute('''CREATE TABLE schema_version(
+                        version INTEGER PRIMARY KEY, name TEXT NOT NULL,
+                        applied TIMESTAMP NOT NULL
+                        DEFAULT CURRENT_TIMESTAMP)''')
+        conn.execute("INSERT INTO schema_version VALUES (1, 'x', 0)")
+        conn.commit()
+        conn.close()
+        applied = db.upgrade_db(tmp_path / 'app.sqlite')
+        assert applied == [path.name for _, _, path in
+                           db.list_migrations()[1:]]
+        conn = sqlite3.connect(tmp_path / 'app.sqlite')
+        closure = conn.execute('SELECT * FROM task_closure').fetchall()
+        conn.close()
+        assert closure == [(1, 1, 0)]
+
+    @staticmethod
+    def test_indexes(tmp_path):
+        db.upgrade_db(tmp_path / 'app.sqlite')
+        conn = sqlite3.connect(tmp_path / 'app.sqlite')
+        result = conn.execute('''SELECT name FROM sqlite_master
+                                WHERE type='index' AND tbl_name='task'
+                                AND name LIKE 'idx_%';''').fetchall()
+        conn.close()
+        assert {row[0] for row in result} == {
+            'idx_task_parent_id', 'idx_task_status',
+            'idx_task_completed_date', 'idx_task_title'}
+
+    @staticmethod
+    def test_upgrade_command(app):
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['db', 'upgrade'])
+        assert 'Database is up to date (0 applied).' in result.output
+
+
+class TestConnectionPool:
+    @staticmethod
+    def test_connection_reused(app_context):
+        first = db.get_db()
+        db.close_db()
+        assert db.get_db() is first
+
+    @staticmethod
+    def test_pragmas(app_context):
+        d = db.get_db()
+        assert d.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert d.execute('PRAGMA foreign_keys').fetchone()[0] == 1
+        assert d.execute('PRAGMA synchronous').fetchone()[0] == 1
+        assert d.execute('PRAGMA busy_timeout').fetchone()[0] == 5000
+
+    @staticmethod
+    def test_unhealthy_connection_replaced(tmp_path):
+        pool = db.ConnectionPool(tmp_path / 'app.sqlite')
+        conn = pool.checkout()
+        pool.checkin(conn)
+        conn.close()
+        new_conn = pool.checkout()
+        assert new_conn is not conn
+        assert pool.is_healthy(new_conn)
+        pool.close()
+
+    @staticmethod
+    def test_size_limit(tmp_path):
+        pool = db.ConnectionPool(tmp_path / 'app.sqlite', size=1)
+        first, second = pool.checkout(), pool.checkout()
+        pool.checkin(first)
+        pool.checkin(second)
+        assert pool.checkout() is first
+        assert not pool.is_healthy(second)
+        pool.close()
+
+    @staticmethod
+    def test_rollback_on_checkin(app_context):
+        d = db.get_db()
+        d.execute("INSERT INTO task (title) VALUES ('uncommitted')")
+        db.close_db()
+        d = db.get_db()
+        count = d.execute("SELECT COUNT(*) FROM task "
+                          "WHERE title = 'uncommitted'").fetchone()[0]
+        assert count == 0
+
+    @staticmethod
+    def test_closed_pool(tmp_path):
+        pool = db.ConnectionPool(tmp_path / 'app.sqlite')
+        pool.close()
+        with pytest.raises(sqlite3.ProgrammingError):
+            pool.checkout()
+
+
+class TestHandleLocked:
+    @staticmethod
+    def test_locked(app, client):
+        app.config['DB_BUSY_TIMEOUT'] = 0
+        db.close_pool(app.config['DATABASE'])
+        other = sqlite3.connect(app.config['DATABASE'])
+        other.execute('BEGIN IMMEDIATE')
+        response = client.post('/api/v1/tasks', json={'title': 'new'})
+        other.rollback()
+        other.close()
+        assert response.status_code == 503
+        assert response.json == {'error': 'Database is locked.'}
+        assert response.headers['Retry-After'] == '1'
+
+    @staticmethod
+    def test_other_errors_raised(app):
+        @app.route('/broken')
+        def broken():
+            raise sqlite3.OperationalError('no such table: nope')
+        app.testing = False
+        assert app.test_client().get('/broken').status_code == 500
@@ -1,4 +1,4 @@
-from app.flask_app import create_app
+from app.flask_app import create_app, db
 from flask import Flask, g
 import os
 
@@ -25,3 +25,16 @@ def test_teardown(app):
     with app.test_client() as client:
         client.get('/api/v1/tasks?id=1')
         assert 'db' not in g
+
+
+def test_restart_keeps_data(tmp_path):
+    app = create_app(instance_path=tmp_path)
+    with app.app_context():
+        d = db.get_db()
+        d.execute("INSERT INTO task (title) VALUES ('keep me')")
+        d.commit()
+    app = create_app(instance_path=tmp_path)
+    with app.app_context():
+        count = db.get_db().execute(
+            "SELECT COUNT(*) FROM task WHERE title = 'keep me'").fetchone()[0]
+    assert count == 1
@@ -0,0 +1,110 @@
+from app.flask_app import create_app, db, metrics
+from app.src.db import close_pool
+import sqlite3
+import os
+import re
+
+
+class TestInstrumentedConnection:
+    @staticmethod
+    def test_counts_statements():
+        conn = sqlite3.connect(':memory:',
+                               factory=metrics.InstrumentedConnection)
+        conn.execute('CREATE TABLE t (x)')
+        conn.executemany('INSERT INTO t VALUES (?)', [(1,), (2,)])
+        conn.execute('SELECT * FROM t').fetchall()
+        assert conn.queries == 3
+        assert conn.seconds > 0
+        conn.reset()
+        assert conn.queries == 0
+        conn.close()
+
+    @staticmethod
+    def test_reset_on_checkout(app_context):
+        d = db.get_db()
+        d.execute('SELECT 1')
+        db.close_db()
+        assert db.get_db().queries == 0
+
+
+class TestMetrics:
+    @staticmethod
+    def test_histogram():
+        histogram = metrics.Histogram(buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value)
+        assert histogram.counts == [1, 2]
+        assert histogram.count == 3
+
+    @staticmethod
+    def test_labels_escaped():
+        assert metrics.format_labels(('a', 'b'), ('x"y', 'z\\')) == \
+            'a="x\\"y",b="z\\\\"'
+
+    @staticmethod
+    def test_server_timing(client):
+        response = client.get('/api/v1/tasks?id=1')
+        timing = response.headers['Server-Timing']
+        assert re.match(r'db;dur=[\d.]+;desc="2 queries", total;dur=[\d.]+',
+                        timing)
+
+    @staticmethod
+    def test_endpoint(client):
+        client.get('/api/v1/tasks?id=1')
+        client.get('/filter?mode=ongoing')
+        response = client.get('/api/v1/metrics')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        text = response.text
+        assert 'todo_request_duration_seconds_count{endpoint="todo.filter",' \
+            'method="GET"} 1' in text
+        # data version lookup of the ETag and the task query
+        assert 'todo_db_queries_total{endpoint="api.task_by_id",' \
+            'method="GET"} 2' in text
+        assert 'todo_responses_total{endpoint="api.task_by_id",' \
+            'method="GET",status="200"} 1' in text
+        assert 'todo_task_cache_misses_total' in text
+
+    @staticmethod
+    def test_disabled(tmp_path):
+        app = create_app({'TESTING': True, 'SQL_METRICS': False,
+                          'SLOW_QUERY_MS': None},
+                         instance_path=tmp_path)
+        with app.app_context():
+            db.init_db(tmp_path, load_sample=False)
+        client = app.test_client()
+        response = client.get('/api/v1/tasks?id=1')
+        assert 'Server-Timing' not in response.headers
+        assert client.get('/api/v1/metrics').status_code == 404
+        with app.app_context():
+            assert type(db.get_db()) is sqlite3.Connection
+        close_pool(app.config['DATABASE'])
+
+
+class TestSlowQueryLog:
+    @staticmethod
+    def test_explain(app_context):
+        plan = metrics.explain(db.get_db(),
+                               'SELECT title FROM task WHERE id = ?', (1,))
+        assert plan == ['SEARCH task USING INTEGER PRIMARY KEY (rowid=?)']
+
+    @staticmethod
+    def test_logged(tmp_path):
+        app = create_app({'TESTING': True, 'SLOW_QUERY_MS': 0.000001},
+                         instance_path=tmp_path)
+        with app.app_context():
+            db.init_db(tmp_path, load_sample=False)
+            db.get_db().execute('SELECT title FROM task WHERE parent_id = ?',
+                                (1,))
+        close_pool(app.config['DATABASE'])
+        log = (tmp_path / 'slow_queries.log').read_text()
+        assert 'sql: SELECT title FROM task WHERE parent_id = ?' in log
+        assert 'parameters: (1,)' in log
+        assert 'SEARCH task USING INDEX idx_task_parent_id' in log
+
+    @staticmethod
+    def test_not_logged(app):
+        with app.app_context():
+            db.get_db().execute('SELECT 1')
+        assert not os.path.exists(
+            os.path.join(app.instance_path, 'slow_queries.log'))
@@ -0,0 +1,67 @@
+from app.flask_app import create_app, db, profiler
+from app.src.db import close_pool
+import pstats
+import pytest
+
+
+@pytest.fixture
+def profiled_app(tmp_path):
+    app = create_app({'TESTING': True, 'PROFILER': True, 'PROFILER_KEEP': 2},
+                     instance_path=tmp_path)
+    with app.app_context():
+        db.init_db(tmp_path, load_sample=False)
+    yield app
+    close_pool(app.config['DATABASE'])
+
+
+class TestRequestProfiler:
+    @staticmethod
+    def test_disabled(client, app):
+        client.get('/?profile=1')
+        assert not profiler.get_folder(app).exists()
+        assert client.get('/api/v1/profiles').status_code == 404
+
+    @staticmethod
+    def test_triggers(profiled_app):
+        client = profiled_app.test_client()
+        client.get('/api/v1/tasks?id=1')
+        client.get('/api/v1/tasks?id=1&profile=0')
+        assert profiler.list_profiles(profiler.get_folder(profiled_app)) \
+            == []
+        client.get('/api/v1/tasks?id=1&profile=1')
+        client.get('/', headers={'X-Profile': '1'})
+        paths = profiler.list_profiles(profiler.get_folder(profiled_app))
+        assert [profiler.describe_profile(path)['path']
+                for path in paths] == ['/', '/api/v1/tasks']
+        assert pstats.Stats(str(paths[0])).total_calls > 0
+
+    @staticmethod
+    def test_keep(profiled_app):
+        client = profiled_app.test_client()
+        for _ in range(3):
+            client.get('/?profile=1')
+        folder = profiler.get_folder(profiled_app)
+        assert len(profiler.list_profiles(folder)) == 2
+
+    @staticmethod
+    def test_not_allowed(profiled_app):
+        client = profiled_app.test_client()
+        remote = {'REMOTE_ADDR': '10.0.0.1'}
+        client.get('/?profile=1', environ_base=remote)
+        assert not profiler.get_folder(profiled_app).exists()
+        assert client.get('/api/v1/profiles',
+                          environ_base=remote).status_code == 404
+
+    @staticmethod
+    def test_index(profiled_app):
+        client = profiled_app.test_client()
+        client.get('/api/v1/tasks/stats?profile=1')
+        profiles = client.get('/api/v1/profiles').json['profiles']
+        assert len(profiles) == 1
+        assert profiles[0]['method'] == 'GET'
+        assert profiles[0]['path'] == '/api/v1/tasks/stats'
+        response = client.get(f"/api/v1/profiles/{profiles[0]['name']}")
+        assert response.status_code == 200
+        assert len(response.data) == profiles[0]['size']
+        assert client.get('/api/v1/profiles/../app.sqlite').status_code \
+            == 404
@@ -0,0 +1,78 @@
+from app.flask_app import api
+from app.src.db import get_db
+from app.src.metrics import explain
+from test.helpers import (
+    capture_queries, assert_uses_index, table_scans, temp_sorts)
+import pytest
+
+# calls that only touch a subtree, a lineage or a page of tasks
+# and must not read the whole task table
+CRITICAL_CALLS = {
+    'get_task.tree': lambda: api.get_task(2, 'tree'),
+    'get_task.single': lambda: api.get_task(2, 'single'),
+    'get_task.children': lambda: api.get_task(2, 'children'),
+    'get_task.nested': lambda: api.get_task(2, 'nested'),
+    'get_task.all.page': lambda: api.get_task(None, 'all', after_id=2,
+                                              limit=2, max_depth=3),
+    'get_tasks': lambda: api.get_tasks([1, 4]),
+    'get_stats.subtree': lambda: api.get_stats(2),
+    'search_tasks': lambda: api.search_tasks('bottom'),
+    'search_parents': lambda: api.search_parents('main', id=2),
+    'show_lineage': lambda: api.show_lineage(5),
+    'show_lineages': lambda: api.show_lineages([3, 5]),
+    'is_descendant': lambda: api.is_descendant(get_db(), 5, 2),
+    'export.root': lambda: list(api.iter_csv(*api.export_query(2))),
+    'post_task': lambda: api.post_task({'title': 'new', 'parent_id': 4}),
+    'patch_task': lambda: api.patch_task(5, {'parent_id': 3}),
+    'patch_status': lambda: api.patch_status('FULL', root=2),
+    'delete_task': lambda: api.delete_task(2, cascade=True),
+}
+
+# pages (and streams) must return their first row without sorting
+# the rest of the table
+PAGE_QUERIES = {
+    'all_tasks_query': lambda: api.all_tasks_query(2, 2),
+    'all_tasks_query.max_depth': lambda: api.all_tasks_query(2, 2, 3),
+}
+
+
+class TestQueryPlans:
+    @staticmethod
+    @pytest.mark.parametrize('name', list(CRITICAL_CALLS))
+    def test_no_task_scan(app_context, name):
+        db = get_db()
+        with capture_queries(db) as queries:
+            CRITICAL_CALLS[name]()
+        assert queries
+        for sql, parameters in queries:
+            # no plan for executemany / executescript and transactions
+            if parameters is None or not sql.strip().upper().startswith(
+                    ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')):
+                continue
+            assert_uses_index(db, sql, parameters)
+
+    @staticmethod
+    @pytest.mark.parametrize('name', list(PAGE_QUERIES))
+    def test_no_sort(app_context, name):
+        sql, parameters = PAGE_QUERIES[name]()
+        assert temp_sorts(get_db(), sql, parameters) == []
+        assert_uses_index(get_db(), sql, parameters)
+
+    @staticmethod
+    def test_search_parents_stops_at_limit(app_context):
+        db = get_db()
+        with capture_queries(db) as queries:
+            api.search_parents('', id=2, limit=1)
+        (sql, parameters), = queries
+        plan = '\n'.join(explain(db, sql, parameters))
+        # no subtree list built up front, no sort of all matches
+        assert 'LIST SUBQUERY' not in plan
+        assert temp_sorts(db, sql, parameters) == []
+
+    @staticmethod
+    def test_detects_scan(app_context):
+        db = get_db()
+        sql = 'SELECT t.id FROM task t WHERE t.created = ?'
+        assert table_scans(db, sql, ('x',)) == ['SCAN t']
+        with pytest.raises(AssertionError):
+            assert_uses_index(db, sql, ('x',))
@@ -23,16 +23,35 @@ class TestRouting:
     @staticmethod
     def test_home(client, monkeypatch):
         monkeypatch.setattr('app.src.todo.render_template',
-                            lambda file, tasks, parents: file)
+                            lambda file, tasks: file)
         response = client.get('/')
         assert response.status_code == 200
         assert response.data == b'index.html'
 
+    @staticmethod
+    def test_home_progress(client, monkeypatch):
+        monkeypatch.setattr('app.src.todo.render_template',
+                            lambda file, tasks: tasks)
+        trees = client.get('/').json
+        assert trees[1]['progress'] == {'id': 2, 'total': 3, 'empty': 2,
+                                        'half': 0, 'full': 1}
+
+    @staticmethod
+    def test_home_progress_without_stats_query(client, monkeypatch):
+        def fail(*args):
+            raise AssertionError('stats should not be queried')
+        monkeypatch.setattr('app.src.api.get_stats', fail)
+        monkeypatch.setattr('app.src.todo.render_template',
+                            lambda file, tasks: tasks)
+        trees = client.get('/').json
+        assert trees[0]['progress'] == {'id': 1, 'total': 2, 'empty': 1,
+                                        'half': 1, 'full': 0}
+
     @staticmethod
     def test_single_task(client, monkeypatch):
         monkeypatch.setattr('app.src.todo.render_template',
                             lambda file, main_task, tasks,
-                            edit_parents, new_parents: file)
+                            parent, new_parents: file)
         response = client.get('/1')
         assert response.status_code == 200
         assert response.data == b'single_task.html'
@@ -51,8 +70,8 @@ def replace_func_for_filter(monkeypatch):
     monkeypatch.setattr('app.src.api.get_task',
                         lambda id, mode: ({'tasks': [{'id': 1, 'mode': mode}]},
                                           200))
-    monkeypatch.setattr('app.src.api.show_lineage',
-                        lambda id: ({}, 200))
+    monkeypatch.setattr('app.src.api.show_lineages',
+                        lambda ids: ({'lineages': {1: 'Parent'}}, 200))
     monkeypatch.setattr('app.src.todo.render_template',
                         lambda file, tasks: {'file': file, 'data': tasks})
 
@@ -64,7 +83,8 @@ class TestFilter:
         result = json.loads(response.data)
         assert response.status_code == 200
         assert result['file'] == 'filter.html'
-        assert result['data'] == [{'id': 1, 'mode': 'HALF'}]
+        assert result['data'] == [{'id': 1, 'mode': 'HALF',
+                                   'lineage': 'Parent'}]
 
     @staticmethod
     def test_filter_pending(replace_func_for_filter, client):
@@ -72,7 +92,8 @@ class TestFilter:
         result = json.loads(response.data)
         assert response.status_code == 200
         assert result['file'] == 'filter.html'
-        assert result['data'] == [{'id': 1, 'mode': 'EMPTY'}]
+        assert result['data'] == [{'id': 1, 'mode': 'EMPTY',
+                                   'lineage': 'Parent'}]
 
     @staticmethod
     def test_filter_completed(replace_func_for_filter, client):
@@ -80,7 +101,8 @@ class TestFilter:
         result = json.loads(response.data)
         assert response.status_code == 200
         assert result['file'] == 'filter.html'
-        assert result['data'] == [{'id': 1, 'mode': 'FULL'}]
+        assert result['data'] == [{'id': 1, 'mode': 'FULL',
+                                   'lineage': 'Parent'}]
 
     @staticmethod
     def test_filter_bad_mode(replace_func_for_filter, client):
@@ -88,7 +110,8 @@ class TestFilter:
         result = json.loads(response.data)
         assert response.status_code == 200
         assert result['file'] == 'filter.html'
-        assert result['data'] == [{'id': 1, 'mode': 'all'}]
+        assert result['data'] == [{'id': 1, 'mode': 'all',
+                                   'lineage': 'Parent'}]
 
 
 @pytest.fixture
@@ -115,6 +138,15 @@ class TestSubmit:
         assert response.status_code == 200
         assert response.data == b'/100'
 
+    @staticmethod
+    def test_delete_cascade(client, submit_data, monkeypatch):
+        calls = []
+        monkeypatch.setattr('app.src.todo.redirect', lambda url: url)
+        monkeypatch.setattr('app.src.api.delete_task',
+                            lambda id, cascade: calls.append((id, cascade)))
+        client.post('/submit?process=delete&cascade=true', data=submit_data)
+        assert calls == [('2', True)]
+
     @staticmethod
     def test_edit(client, submit_data, monkeypatch):
         monkeypatch.setattr('app.src.todo.redirect', lambda url: url)
@@ -160,6 +192,40 @@ def test_tasks_to_trees(tasks):
     assert trees == expected
 
 
+def test_tasks_to_trees_does_not_modify(tasks):
+    copied = [dict(task) for task in tasks]
+    todo.tasks_to_trees(tasks)
+    assert tasks == copied
+
+
+def test_tasks_to_trees_any_order(tasks):
+    trees = todo.tasks_to_trees(list(reversed(tasks)))
+    assert [tree['id'] for tree in trees] == [2, 1]
+    assert trees[0]['sub_tasks'][0]['sub_tasks'][0]['id'] == 5
+
+
+def test_tasks_to_trees_subtree(tasks):
+    trees = todo.tasks_to_trees(tasks[3:])
+    assert [tree['id'] for tree in trees] == [4]
+    assert trees[0]['sub_tasks'][0]['id'] == 5
+
+
+def test_add_progress_matches_stats(app_context):
+    from app.src import api
+    from app.src.utils import add_progress
+    api.post_task({'title': 'New', 'parent_id': 5})
+    api.patch_task(3, {'parent_id': 5})
+    data, _ = api.get_task(None, 'all')
+    trees = add_progress(todo.tasks_to_trees(data['tasks']))
+    nodes, progress = list(trees), {}
+    while nodes:
+        node = nodes.pop()
+        progress[node['id']] = node['progress']
+        nodes.extend(node.get('sub_tasks', []))
+    stats, _ = api.get_stats()
+    assert progress == {row['id']: row for row in stats['stats']}
+
+
 def test_list_parent_options(tasks):
     result = todo.list_parent_options(tasks)
     expected = [{'id': 1, 'title': 'Main_task_1'},